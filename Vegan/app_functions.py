@@ -1,15 +1,49 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+# Plotting is imported by the functions using it, so that a page only loads it when it 
+# renders a wordcloud or a map.
 
-from sre_constants import OP_LOCALE_IGNORE
-import country_converter as coco
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.feather as feather
+from scipy import sparse
+from pathlib import Path
+from io import BytesIO
 import calendar
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import lru_cache
 
+from timing import timed
 
+
+# Terms are runs of word characters, apostrophes allowed after the first one (don't, vegan's)
+TOKEN_PATTERN = re.compile(r"\w[\w']*")
+# Same terms, with the text between them when splitting
+TOKEN_SPLIT_PATTERN = re.compile(r"(\w[\w']*)")
+# Usual texts between two terms, or before the first and after the last term of a text. The 
+# tokens keep which one separates each pair of terms (code: position in SEPARATORS plus one, 
+# 0 for any other text), so that keywords such as plant-based or u.s. are matched from the index
+SEPARATORS = ('', ' ', '-', '.', '. ', ', ', ',', '/', ': ', '; ', ' - ', ' (', ') ', '"', ' "', '" ', '\n', '\n\n',
+              '! ', '? ', ' \'', '’', '’ ')
+SEPARATOR_CODES = {separator: code for code, separator in enumerate(SEPARATORS, 1)}
+# Bit added to the separator code of the first term of a text
+FIRST_TERM = 128
+
+
+@timed
 def create_text(df, col):
     '''
     Returns a string with text of all rows of a certain column in a dateframe. 
@@ -25,9 +59,103 @@ def create_text(df, col):
     return text
 
 
+@timed
+def word_frequencies(term_matrix, vocabulary, rows, stopwords, max_words=200):
+    '''
+    Returns the most frequent words in some articles, to be plotted with WordCloud.generate_from_frequencies.
+
+    Like WordCloud.generate, words of a single character, numbers and stopwords are left out. 
+    Stopwords are removed by vocabulary id, so changing them does not tokenize the articles again.
+
+            Parameters:
+                    term_matrix (csr_matrix): term matrix created with build_term_matrix
+                    vocabulary (list): vocabulary of term_matrix
+                    rows (array): row positions of the articles
+                    stopwords (set): words to leave out
+                    max_words (int): maximal number of words returned
+
+            Returns:
+                    frequencies (dict): word and number of times it appears, most frequent first
+    '''
+    counts = np.asarray(term_matrix[rows].sum(axis=0)).ravel()
+    stopword_ids = []
+    for word in {word.lower() for word in stopwords}:
+        term_id = bisect_left(vocabulary, word)
+        if term_id < len(vocabulary) and vocabulary[term_id] == word:
+            stopword_ids.append(term_id)
+    counts[stopword_ids] = 0
+    # Most frequent terms first, ties in vocabulary order
+    term_ids = np.flatnonzero(counts)
+    term_ids = term_ids[np.argsort(-counts[term_ids], kind='stable')]
+    frequencies = {}
+    for term_id in term_ids:
+        word = vocabulary[term_id]
+        if len(word) > 1 and not word.isdigit():
+            frequencies[word] = int(counts[term_id])
+            if len(frequencies) == max_words:
+                break
+    return frequencies
+
+
+@timed
+def create_wordcloud(frequencies):
+    '''
+    Returns the PNG image of a wordcloud of some word frequencies.
+
+            Parameters:
+                    frequencies (dict): words and their frequencies, as returned by word_frequencies
+
+            Returns:
+                    png (bytes)
+    '''
+    from matplotlib.figure import Figure
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(width=800, height=400, colormap='GnBu').generate_from_frequencies(frequencies)
+    # Figure instead of pyplot, so that sessions rendering at the same time do not share state
+    fig_cloud = Figure()
+    ax = fig_cloud.subplots()
+    ax.imshow(wordcloud, interpolation='bilinear')
+    ax.axis("off")
+    fig_cloud.tight_layout(pad=0)
+    png = BytesIO()
+    fig_cloud.savefig(png, format='png')
+    return png.getvalue()
+
+
+@lru_cache(maxsize=None)
+def wordcloud_stopwords():
+    '''
+    Returns the stop words of the wordcloud package (wordcloud.STOPWORDS), read without importing 
+    it, as it imports matplotlib.
+
+            Returns:
+                    stopwords (frozenset)
+    '''
+    package = Path(importlib.util.find_spec('wordcloud').submodule_search_locations[0])
+    with open(package / 'stopwords', encoding='utf-8') as file:
+        return frozenset(line.strip() for line in file)
+
+
+# Country names, ISO3 codes and aliases, generated with make_gazetteer.py
+GAZETTEER_PATH = Path(__file__).parent / 'resources' / 'countries.json'
+
+
+@lru_cache(maxsize=None)
+def gazetteer():
+    '''
+    Returns the country gazetteer, read once per process.
+
+            Returns:
+                    gazetteer (dict): version, source and countries (list of dictionaries with name, 
+                                      iso3 and aliases, e.g. UK for United Kingdom)
+    '''
+    with open(GAZETTEER_PATH, encoding='utf-8') as file:
+        return json.load(file)
+
+
 def countries(with_abbreviations=True):
     '''
-    Returns a list of countries, with or without ISO 3 abbreviations. 
+    Returns a list of countries, with or without their aliases (UK, USA...). 
 
             Parameters:
                     with_abbreviations (boolean)
@@ -35,74 +163,206 @@ def countries(with_abbreviations=True):
             Returns:
                     countries_list (list)
     '''
+    countries_list = [country['name'] for country in gazetteer()['countries']]
     if with_abbreviations:
-        countries_list = ['UK', 'USA', 'Afghanistan', 'Aland Islands', 'Albania', 'Algeria', 'American Samoa', 'Andorra', 'Angola', 'Anguilla', 'Antarctica', 'Antigua and Barbuda', 'Argentina', 'Armenia', 'Aruba', 'Australia', 'Austria', 'Azerbaijan', 'Bahamas', 'Bahrain', 'Bangladesh', 'Barbados', 'Belarus', 'Belgium', 'Belize', 'Benin', 'Bermuda', 'Bhutan', 'Bolivia, Plurinational State of', 'Bonaire, Sint Eustatius and Saba', 'Bosnia and Herzegovina', 'Botswana', 'Bouvet Island', 'Brazil', 'British Indian Ocean Territory', 'Brunei Darussalam', 'Bulgaria', 'Burkina Faso', 'Burundi', 'Cambodia', 'Cameroon', 'Canada', 'Cape Verde', 'Cayman Islands', 'Central African Republic', 'Chad', 'Chile', 'China', 'Christmas Island', 'Cocos (Keeling) Islands', 'Colombia', 'Comoros', 'Congo', 'Congo, The Democratic Republic of the', 'Cook Islands', 'Costa Rica', "Côte d'Ivoire", 'Croatia', 'Cuba', 'Curaçao', 'Cyprus', 'Czech Republic', 'Denmark', 'Djibouti', 'Dominica', 'Dominican Republic', 'Ecuador', 'Egypt', 'El Salvador', 'Equatorial Guinea', 'Eritrea', 'Estonia', 'Ethiopia', 'Falkland Islands (Malvinas)', 'Faroe Islands', 'Fiji', 'Finland', 'France', 'French Guiana', 'French Polynesia', 'French Southern Territories', 'Gabon', 'Gambia', 'Georgia', 'Germany', 'Ghana', 'Gibraltar', 'Greece', 'Greenland', 'Grenada', 'Guadeloupe', 'Guam', 'Guatemala', 'Guernsey', 'Guinea', 'Guinea-Bissau', 'Guyana', 'Haiti', 'Heard Island and McDonald Islands', 'Holy See (Vatican City State)', 'Honduras', 'Hong Kong', 'Hungary', 'Iceland', 'India', 'Indonesia', 'Iran, Islamic Republic of', 'Iraq', 'Ireland', 'Isle of Man', 'Israel', 'Italy', 'Jamaica', 'Japan', 'Jersey', 'Jordan', 'Kazakhstan', 'Kenya', 'Kiribati', "Korea, Democratic People's Republic of", 'Korea, Republic of', 'Kuwait', 'Kyrgyzstan', "Lao People's Democratic Republic", 'Latvia', 'Lebanon', 'Lesotho', 'Liberia', 'Libya', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Macao', 'Macedonia, Republic of', 'Madagascar', 'Malawi', 'Malaysia', 'Maldives', 'Mali', 'Malta', 'Marshall Islands', 'Martinique', 'Mauritania', 'Mauritius', 'Mayotte', 'Mexico', 'Micronesia, Federated States of', 'Moldova, Republic of', 'Monaco', 'Mongolia', 'Montenegro', 'Montserrat', 'Morocco', 'Mozambique', 'Myanmar', 'Namibia', 'Nauru', 'Nepal', 'Netherlands', 'New Caledonia', 'New Zealand', 'Nicaragua', 'Niger', 'Nigeria', 'Niue', 'Norfolk Island', 'Northern Mariana Islands', 'Norway', 'Oman', 'Pakistan', 'Palau', 'Palestinian Territory, Occupied', 'Panama', 'Papua New Guinea', 'Paraguay', 'Peru', 'Philippines', 'Pitcairn', 'Poland', 'Portugal', 'Puerto Rico', 'Qatar', 'Réunion', 'Romania', 'Russian Federation', 'Rwanda', 'Saint Barthélemy', 'Saint Helena, Ascension and Tristan da Cunha', 'Saint Kitts and Nevis', 'Saint Lucia', 'Saint Martin (French part)', 'Saint Pierre and Miquelon', 'Saint Vincent and the Grenadines', 'Samoa', 'San Marino', 'Sao Tome and Principe', 'Saudi Arabia', 'Senegal', 'Serbia', 'Seychelles', 'Sierra Leone', 'Singapore', 'Sint Maarten (Dutch part)', 'Slovakia', 'Slovenia', 'Solomon Islands', 'Somalia', 'South Africa', 'South Georgia and the South Sandwich Islands', 'Spain', 'Sri Lanka', 'Sudan', 'Suriname', 'South Sudan', 'Svalbard and Jan Mayen', 'Swaziland', 'Sweden', 'Switzerland', 'Syrian Arab Republic', 'Taiwan, Province of China', 'Tajikistan', 'Tanzania, United Republic of', 'Thailand', 'Timor-Leste', 'Togo', 'Tokelau', 'Tonga', 'Trinidad and Tobago', 'Tunisia', 'Turkey', 'Turkmenistan', 'Turks and Caicos Islands', 'Tuvalu', 'Uganda', 'Ukraine', 'United Arab Emirates', 'United Kingdom', 'United States', 'United States Minor Outlying Islands', 'Uruguay', 'Uzbekistan', 'Vanuatu', 'Venezuela, Bolivarian Republic of', 'Viet Nam', 'Virgin Islands, British', 'Virgin Islands, U.S.', 'Wallis and Futuna', 'Yemen', 'Zambia', 'Zimbabwe']
-    else:
-        countries_list = ['Afghanistan', 'Aland Islands', 'Albania', 'Algeria', 'American Samoa', 'Andorra', 'Angola', 'Anguilla', 'Antarctica', 'Antigua and Barbuda', 'Argentina', 'Armenia', 'Aruba', 'Australia', 'Austria', 'Azerbaijan', 'Bahamas', 'Bahrain', 'Bangladesh', 'Barbados', 'Belarus', 'Belgium', 'Belize', 'Benin', 'Bermuda', 'Bhutan', 'Bolivia, Plurinational State of', 'Bonaire, Sint Eustatius and Saba', 'Bosnia and Herzegovina', 'Botswana', 'Bouvet Island', 'Brazil', 'British Indian Ocean Territory', 'Brunei Darussalam', 'Bulgaria', 'Burkina Faso', 'Burundi', 'Cambodia', 'Cameroon', 'Canada', 'Cape Verde', 'Cayman Islands', 'Central African Republic', 'Chad', 'Chile', 'China', 'Christmas Island', 'Cocos (Keeling) Islands', 'Colombia', 'Comoros', 'Congo', 'Congo, The Democratic Republic of the', 'Cook Islands', 'Costa Rica', "Côte d'Ivoire", 'Croatia', 'Cuba', 'Curaçao', 'Cyprus', 'Czech Republic', 'Denmark', 'Djibouti', 'Dominica', 'Dominican Republic', 'Ecuador', 'Egypt', 'El Salvador', 'Equatorial Guinea', 'Eritrea', 'Estonia', 'Ethiopia', 'Falkland Islands (Malvinas)', 'Faroe Islands', 'Fiji', 'Finland', 'France', 'French Guiana', 'French Polynesia', 'French Southern Territories', 'Gabon', 'Gambia', 'Georgia', 'Germany', 'Ghana', 'Gibraltar', 'Greece', 'Greenland', 'Grenada', 'Guadeloupe', 'Guam', 'Guatemala', 'Guernsey', 'Guinea', 'Guinea-Bissau', 'Guyana', 'Haiti', 'Heard Island and McDonald Islands', 'Holy See (Vatican City State)', 'Honduras', 'Hong Kong', 'Hungary', 'Iceland', 'India', 'Indonesia', 'Iran, Islamic Republic of', 'Iraq', 'Ireland', 'Isle of Man', 'Israel', 'Italy', 'Jamaica', 'Japan', 'Jersey', 'Jordan', 'Kazakhstan', 'Kenya', 'Kiribati', "Korea, Democratic People's Republic of", 'Korea, Republic of', 'Kuwait', 'Kyrgyzstan', "Lao People's Democratic Republic", 'Latvia', 'Lebanon', 'Lesotho', 'Liberia', 'Libya', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Macao', 'Macedonia, Republic of', 'Madagascar', 'Malawi', 'Malaysia', 'Maldives', 'Mali', 'Malta', 'Marshall Islands', 'Martinique', 'Mauritania', 'Mauritius', 'Mayotte', 'Mexico', 'Micronesia, Federated States of', 'Moldova, Republic of', 'Monaco', 'Mongolia', 'Montenegro', 'Montserrat', 'Morocco', 'Mozambique', 'Myanmar', 'Namibia', 'Nauru', 'Nepal', 'Netherlands', 'New Caledonia', 'New Zealand', 'Nicaragua', 'Niger', 'Nigeria', 'Niue', 'Norfolk Island', 'Northern Mariana Islands', 'Norway', 'Oman', 'Pakistan', 'Palau', 'Palestinian Territory, Occupied', 'Panama', 'Papua New Guinea', 'Paraguay', 'Peru', 'Philippines', 'Pitcairn', 'Poland', 'Portugal', 'Puerto Rico', 'Qatar', 'Réunion', 'Romania', 'Russian Federation', 'Rwanda', 'Saint Barthélemy', 'Saint Helena, Ascension and Tristan da Cunha', 'Saint Kitts and Nevis', 'Saint Lucia', 'Saint Martin (French part)', 'Saint Pierre and Miquelon', 'Saint Vincent and the Grenadines', 'Samoa', 'San Marino', 'Sao Tome and Principe', 'Saudi Arabia', 'Senegal', 'Serbia', 'Seychelles', 'Sierra Leone', 'Singapore', 'Sint Maarten (Dutch part)', 'Slovakia', 'Slovenia', 'Solomon Islands', 'Somalia', 'South Africa', 'South Georgia and the South Sandwich Islands', 'Spain', 'Sri Lanka', 'Sudan', 'Suriname', 'South Sudan', 'Svalbard and Jan Mayen', 'Swaziland', 'Sweden', 'Switzerland', 'Syrian Arab Republic', 'Taiwan, Province of China', 'Tajikistan', 'Tanzania, United Republic of', 'Thailand', 'Timor-Leste', 'Togo', 'Tokelau', 'Tonga', 'Trinidad and Tobago', 'Tunisia', 'Turkey', 'Turkmenistan', 'Turks and Caicos Islands', 'Tuvalu', 'Uganda', 'Ukraine', 'United Arab Emirates', 'United Kingdom', 'United States', 'United States Minor Outlying Islands', 'Uruguay', 'Uzbekistan', 'Vanuatu', 'Venezuela, Bolivarian Republic of', 'Viet Nam', 'Virgin Islands, British', 'Virgin Islands, U.S.', 'Wallis and Futuna', 'Yemen', 'Zambia', 'Zimbabwe']
-    return countries_list    
+        countries_list = [alias for country in gazetteer()['countries'] for alias in country['aliases']] + countries_list
+    return countries_list
+
+
+@lru_cache(maxsize=None)
+def country_spellings():
+    '''
+    Returns the position in countries(with_abbreviations=False) of each lower-case spelling of a country.
+
+    Aliases have the position of their country, so that their mentions are counted with it.
+
+            Returns:
+                    positions (dict)
+    '''
+    positions = {}
+    for position, country in enumerate(gazetteer()['countries']):
+        for spelling in [country['name']] + country['aliases']:
+            positions[spelling.lower()] = position
+    return positions
+
+
+@lru_cache(maxsize=None)
+def country_terms():
+    '''
+    Returns the terms of each spelling of a country, as tokenized in the articles.
+
+            Returns:
+                    spellings (list): (terms, position) tuples, terms being a tuple of lower-case terms 
+                                      and position that of the country in countries(with_abbreviations=False)
+    '''
+    return [(tuple(TOKEN_PATTERN.findall(spelling)), position) for spelling, position in country_spellings().items()]
+
+
+def country_mentions(encoded, vocabulary):
+    '''
+    Returns the country mentions in an encoded column, from the term ids only.
+
+    A spelling of a country is mentioned where its terms follow each other in a text; a term 
+    followed by an apostrophe (uk's) counts as the term. Like whole-word matching, a mention 
+    inside a longer one (guinea in papua new guinea) is not counted.
+
+            Parameters:
+                    encoded (dict): tokens and offsets of a column, created with encode_columns
+                    vocabulary (list): sorted terms of the tokens
+
+            Returns:
+                    rows (array): row of the text of each mention
+                    columns (array): position of each country mentioned in countries(with_abbreviations=False)
+    '''
+    spellings = country_terms()
+    words = sorted({word for terms, _ in spellings for word in terms}, key=len)
+    word_ids = {word: word_id for word_id, word in enumerate(words)}
+    # Word id of the vocabulary terms that are a word of a country, -1 for the others
+    word_of = np.full(len(vocabulary), -1, dtype=np.int32)
+    # Shorter words first, so that uk's is mapped to the longest word it starts with
+    for word, word_id in word_ids.items():
+        first = bisect_left(vocabulary, word)
+        if first < len(vocabulary) and vocabulary[first] == word:
+            word_of[first] = word_id
+        # Terms starting with word' are contiguous in the sorted vocabulary
+        first = bisect_left(vocabulary, word + "'", lo=first)
+        last = bisect_left(vocabulary, word + "'\U0010ffff", lo=first)
+        word_of[first:last] = word_id
+    tokens, offsets = encoded['tokens'], encoded['offsets']
+    token_words = word_of[tokens]
+    candidates = np.flatnonzero(token_words >= 0)
+    # Candidates grouped by word, still in order of position within a word
+    order = np.argsort(token_words[candidates], kind='stable')
+    bounds = np.searchsorted(token_words[candidates][order], np.arange(len(words) + 1))
+    starts, lengths, columns = [], [], []
+    for terms, column in spellings:
+        ids = [word_ids[term] for term in terms]
+        start = candidates[order[bounds[ids[0]]:bounds[ids[0] + 1]]]
+        start = start[start + len(ids) <= len(tokens)]
+        for offset, word_id in enumerate(ids[1:], 1):
+            start = start[token_words[start + offset] == word_id]
+        starts.append(start)
+        lengths.append(np.full(len(start), len(ids)))
+        columns.append(np.full(len(start), column, dtype=np.int32))
+    starts, lengths, columns = np.concatenate(starts), np.concatenate(lengths), np.concatenate(columns)
+    rows = np.searchsorted(offsets, starts, side='right') - 1
+    # A mention must end in the text where it starts
+    within = starts + lengths <= offsets[rows + 1]
+    starts, lengths, columns, rows = starts[within], lengths[within], columns[within], rows[within]
+    # Longest mention first at each position, then mentions starting before the end of a previous one are left out
+    order = np.lexsort((-lengths, starts))
+    starts, lengths, columns, rows = starts[order], lengths[order], columns[order], rows[order]
+    ends = np.maximum.accumulate(starts + lengths)
+    kept = np.ones(len(starts), dtype=bool)
+    kept[1:] = starts[1:] >= ends[:-1]
+    return rows[kept].astype(np.int32), columns[kept]
+
+
+def count_countries(texts):
+    '''
+    Returns how many times each country is mentioned in some texts, aliases included.
+
+            Parameters:
+                    texts (iterable): lower-case texts
+
+            Returns:
+                    counts (Counter): mentions by lower-case country name, as in countries(with_abbreviations=False)
+    '''
+    vocabulary, encoded = encode_columns({'texts': texts}, ['texts'])
+    _, columns = country_mentions(encoded['texts'], vocabulary)
+    names = [country.lower() for country in countries(with_abbreviations=False)]
+    number = np.bincount(columns, minlength=len(names))
+    return Counter({names[column]: int(number[column]) for column in np.flatnonzero(number)})
+
+
+def build_country_matrix(encoded, vocabulary):
+    '''
+    Returns a sparse matrix with the number of times each country is mentioned in each article.
+
+    Mentions never change, so the matrix is built once and create_df_countries only sums 
+    the rows of the selected articles.
+
+            Parameters:
+                    encoded (dict): tokens and offsets of a column, created with encode_columns
+                    vocabulary (list): sorted terms of the tokens
+
+            Returns:
+                    matrix (csr_matrix): one row per article, one column per country in countries(with_abbreviations=False),
+                                         aliases included
+    '''
+    rows, columns = country_mentions(encoded, vocabulary)
+    # Repeated (row, col) pairs are summed when converting to CSR
+    data = np.ones(len(rows), dtype=np.int32)
+    matrix = sparse.coo_matrix((data, (rows, columns)), shape=(len(encoded['offsets']) - 1, len(gazetteer()['countries'])))
+    return matrix.tocsr()
+
+
+def country_codes():
+    '''
+    Returns the ISO3 code of each country in countries(with_abbreviations=False), in the same order.
+
+            Returns:
+                    code_list (list)
+    '''
+    return [country['iso3'] for country in gazetteer()['countries']]
 
 
-def create_df_countries(df, col):
+@timed
+def create_df_countries(df, col, matrix=None, counts=None, rows=None):
     '''
     Returns a dataframe with number of times each country is mentioned in article. 
 
+    Mentions of aliases are already counted with their country (e.g. UK with United Kingdom).
+
             Parameters:
                     df (DataFrame): a dataframe with at least one column of type string
                     col (str): name of a column in df
+                    matrix (csr_matrix): optional country matrix of col created with build_country_matrix,
+                                         the index of df must then be the row positions in the matrix
+                    counts (Counter): optional mentions of each lower-case country name, as returned by 
+                                      count_countries (e.g. merged over batches); df and col are then not used
+                    rows (array): optional row positions in matrix of the selected articles, e.g. from 
+                                  search_rows; df is then not used, so it does not have to be sliced
 
             Returns:
                     cited_countries (DataFrame)
     '''
-    countries_list = countries(with_abbreviations=True)
-    # Convert country names to lowercase to use it in the lower case news dataframe
-    countries_list_lower = [country.lower() for country in countries_list]
-    # Create a dictionary to revert country names back to correct form
-    dic_lower_upper = {countries_list_lower[i]: countries_list[i] for i in range(len(countries_list_lower))}
-    # Get ISO3 code for each country in list, add code for UK abreviation
-    code_list = coco.convert(names=countries_list, to='ISO3')
-    code_list[0] = 'GBR'
-    dic_code_country = {countries_list[i]: code_list[i] for i in range(len(countries_list))}
-    text = create_text(df, col)
-    word_count = [(dic_lower_upper[word], text.count(word)) for word in countries_list_lower]    
-    word_count = sorted(word_count, key=lambda i: i[1], reverse=True)
-    x, y = zip(*word_count)        
-    # Dataframe with countries and number of times they are mentioned in texts
-    cited_countries = pd.DataFrame(word_count, columns =['Country', 'Number of times'])
-    # Add column with country codes
-    cited_countries['code'] = cited_countries['Country'].map(dic_code_country)
-    # Consolidate rows: UK + United Kingdom, USA + United States
-    united_kingdom = cited_countries.loc[cited_countries.Country=='United Kingdom']['Number of times'].item()
-    uk = cited_countries.loc[cited_countries.Country=='UK']['Number of times'].item()
-    cited_countries.loc[cited_countries.Country=='United Kingdom', 'Number of times']= united_kingdom + uk
-    united_states = cited_countries.loc[cited_countries.Country=='United States']['Number of times'].item()
-    usa = cited_countries.loc[cited_countries.Country=='USA']['Number of times'].item()
-    cited_countries.loc[cited_countries.Country=='United States', 'Number of times']= united_states + usa
-    cited_countries = cited_countries[cited_countries.Country.isin(['UK', 'USA'])==False]
-    # Sort dataframe by number of times countries are cited
-    cited_countries = cited_countries.sort_values(by=['Number of times'], ascending=False)
-    return cited_countries
+    countries_list = countries(with_abbreviations=False)
+    if counts is None and matrix is None:
+        counts = count_countries(df[col].astype(str))
+    if counts is None:
+        # Sum the mentions of the selected articles only
+        if rows is None:
+            rows = df.index.to_numpy()
+        number = np.asarray(matrix[rows].sum(axis=0)).ravel()
+    else:
+        number = [counts[country.lower()] for country in countries_list]
+    # Dataframe with countries, number of times they are mentioned in texts and country codes
+    cited_countries = pd.DataFrame({'Country': countries_list, 'Number of times': number, 'code': country_codes()})
+    # Sort dataframe by number of times countries are cited, ties in alphabetical order
+    return cited_countries.sort_values(by=['Number of times'], ascending=False, kind='stable')
 
 
-def create_map(df, projection_type):
+@lru_cache(maxsize=None)
+def map_template():
     '''
-    Returns a Plotly choropleth map showing how often countries are cited in articles.
+    Returns the choropleth map of all countries without counts, built once per process.
 
-            Parameters:
-                    df (DataFrame): a dataframe with at least one column of type string
-                    projection_type (str): type of projection as described in [Plotly's documentation](https://plotly.com/python/map-configuration/#map-projections)
+    The geometry locations (ISO3 codes), names, colorscale and layout do not depend on the 
+    articles; map_figure only adds the counts and the projection. Plotly's default template 
+    is left out: Streamlit applies its own theme, and Plotly adds it back in a Figure.
 
             Returns:
-                    cited_countries (DataFrame)
+                    template (dict): Plotly figure as a dictionary, with 'data' and 'layout'
     '''
+    import plotly.graph_objects as go
     fig = go.Figure(data=go.Choropleth(
-        locations = df['code'],
-        z = df['Number of times'],
-        text = df['Country'],
+        locations = country_codes(),
+        text = countries(with_abbreviations=False),
         colorscale = 'GnBu',
         autocolorscale=False,
         reversescale=False,
         hoverinfo=["z"],
-        hovertext = df['Country'],
         marker_line_color='darkgray',
         marker_line_width=0.5,
         colorbar_title = 'Number of<br>mentions',
@@ -111,90 +371,1926 @@ def create_map(df, projection_type):
         margin={"r":0,"t":0,"l":0,"b":0},
         geo=dict(
             showcoastlines=False,
-            projection_type=projection_type,
             bgcolor= 'rgba(0,0,0,0)',
             oceancolor = 'rgba(220,220,220,0.1)',
             showframe = False,
             showocean = True   
         )
     )
-    return fig
+    template = fig.to_plotly_json()
+    template['layout'].pop('template', None)
+    return template
 
-def load_data(file_path):
+
+@timed
+def map_figure(df, projection_type):
     '''
-    Returns dataframe with raw data and a dataframe with lower case.
+    Returns a choropleth map showing how often countries are cited in articles, as a dictionary.
+
+    Only the counts and the projection are set on a copy of map_template, the rest is shared.
+
+            Parameters:
+                    df (DataFrame): countries and number of times they are cited, from create_df_countries
+                    projection_type (str): type of projection as described in [Plotly's documentation](https://plotly.com/python/map-configuration/#map-projections)
+
+            Returns:
+                    figure (dict): Plotly figure, e.g. for st.plotly_chart
+    '''
+    template = map_template()
+    trace = template['data'][0]
+    z = df.set_index('code')['Number of times'].reindex(trace['locations'], fill_value=0)
+    layout = template['layout']
+    return {'data': [{**trace, 'z': z.tolist()}],
+            'layout': {**layout, 'geo': {**layout['geo'], 'projection': {'type': projection_type}}}}
+
+
+@timed
+def create_map(df, projection_type):
+    '''
+    Returns a Plotly choropleth map showing how often countries are cited in articles.
+
+            Parameters:
+                    df (DataFrame): countries and number of times they are cited, from create_df_countries
+                    projection_type (str): type of projection as described in [Plotly's documentation](https://plotly.com/python/map-configuration/#map-projections)
+
+            Returns:
+                    fig (Figure)
+    '''
+    import plotly.graph_objects as go
+    return go.Figure(map_figure(df, projection_type))
+
+# Columns searched by the app, stored in lower case in the snapshot
+LOWER_COLUMNS = ['Title', 'Text']
+
+
+def file_checksum(file_path):
+    '''
+    Returns the SHA-256 checksum of a file, read in blocks.
+
+            Parameters:
+                    file_path (str): path to the file
+
+            Returns:
+                    checksum (str): hexadecimal digest
+    '''
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def snapshot_path(file_path):
+    '''
+    Returns the path of the columnar snapshot of a raw data file.
 
             Parameters:
                     file_path (str): path to raw data
 
             Returns:
-                    df (DataFrame): raw data dataframe
-                    df_lower (DataFrame): lower-case dataframe
+                    path (Path): raw data path with a .feather extension
+    '''
+    return Path(file_path).with_suffix('.feather')
+
+
+def read_articles(file_path):
+    '''
+    Returns the articles of a CSV file as an Arrow table, with parsed dates and lower-case 
+    copies of the columns in LOWER_COLUMNS (as lower_Title and lower_Text).
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    table (Table)
     '''
     df = pd.read_csv(file_path)
     df['Date'] = pd.to_datetime(df['Date'], format="%m/%d/%Y")
-    df_lower = df.apply(lambda x: x.astype(str).str.lower())
-    df_lower['Date'] = pd.to_datetime(df_lower['Date'], format="%Y/%m/%d")
+    for col in LOWER_COLUMNS:
+        df['lower_' + col] = df[col].astype(str).str.lower()
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_feather(table, path, chunksize=None):
+    '''
+    Writes an uncompressed Feather file next to its final path and renames it, so readers 
+    never see a partial file. Each call writes its own temporary file, so processes writing 
+    the same file at the same time do not overwrite each other's; the last rename wins.
+
+            Parameters:
+                    table (Table): data to write
+                    path (Path): path of the file
+                    chunksize (int): rows per record batch, Arrow's default if None
+    '''
+    descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=path.stem + '.', suffix=path.suffix + '.tmp')
+    os.close(descriptor)
+    try:
+        feather.write_feather(table, temporary_path, compression='uncompressed', chunksize=chunksize)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def write_snapshot(file_path, checksum=None):
+    '''
+    Parses the raw data once and writes it as an uncompressed Feather (Arrow) snapshot.
+
+    The snapshot holds the parsed dates, the original columns and lower-case copies of the 
+    columns in LOWER_COLUMNS (as lower_Title and lower_Text). The CSV checksum is stored in 
+    the schema metadata to detect when the snapshot is out of date.
+
+            Parameters:
+                    file_path (str): path to raw data
+                    checksum (str): checksum of file_path, computed if not given
+
+            Returns:
+                    path (Path): path of the snapshot
+    '''
+    if checksum is None:
+        checksum = file_checksum(file_path)
+    table = read_articles(file_path)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'csv_sha256': checksum.encode()})
+    path = snapshot_path(file_path)
+    write_feather(table, path)
+    return path
+
+
+def snapshot_checksum(path):
+    '''
+    Returns the CSV checksum stored in a snapshot, or None if there is no valid snapshot.
+
+            Parameters:
+                    path (Path): path of the snapshot
+
+            Returns:
+                    checksum (str)
+    '''
+    try:
+        with pa.memory_map(str(path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    checksum = metadata.get(b'csv_sha256')
+    return checksum.decode() if checksum else None
+
+
+def manifest_path(file_path):
+    '''
+    Returns the path of the manifest listing the batches of articles appended to a raw data file.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    path (Path): raw data path with a .manifest.json extension
+    '''
+    return Path(file_path).with_suffix('.manifest.json')
+
+
+def read_manifest(file_path):
+    '''
+    Returns the batches appended to the snapshot of a raw data file.
+
+    Batches appended to a previous version of the CSV are ignored: replacing the CSV replaces 
+    the whole dataset.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    batches (list): paths of the batch snapshots, in order of appending
+    '''
+    try:
+        manifest = json.loads(manifest_path(file_path).read_text())
+    except FileNotFoundError:
+        return []
+    if manifest['csv_sha256'] != snapshot_checksum(snapshot_path(file_path)):
+        return []
+    return [Path(file_path).parent / batch for batch in manifest['batches']]
+
+
+def append_articles(file_path, batch_path):
+    '''
+    Appends a CSV file of new articles to the dataset of a raw data file, without rewriting it.
+
+    The batch is parsed into its own snapshot, then added to the manifest, which is replaced 
+    atomically: readers see either all the articles of the batch or none. There must be a 
+    single writer at a time.
+
+            Parameters:
+                    file_path (str): path to raw data
+                    batch_path (str): path to a CSV file with the same columns as file_path
+
+            Returns:
+                    version (int): number of batches appended to file_path
+    '''
+    path = snapshot_path(file_path)
+    # A replaced CSV is snapshotted first: the batch belongs to the new dataset, and the 
+    # batches of the previous one are dropped with it
+    checksum = file_checksum(file_path)
+    if snapshot_checksum(path) != checksum:
+        write_snapshot(file_path, checksum)
+    table = read_articles(batch_path)
+    columns = feather.read_table(path, memory_map=True).schema.names
+    if table.schema.names != columns:
+        raise ValueError(f'Columns of {batch_path} do not match the dataset: {table.schema.names} instead of {columns}.')
+    batches = [batch.name for batch in read_manifest(file_path)]
+    batch = path.with_suffix(f'.batch-{len(batches) + 1:06d}.feather')
+    write_feather(table, batch)
+    manifest = manifest_path(file_path)
+    temporary_path = manifest.with_suffix('.json.tmp')
+    temporary_path.write_text(json.dumps({'csv_sha256': checksum, 'batches': batches + [batch.name]}, indent=1))
+    temporary_path.replace(manifest)
+    return len(batches) + 1
+
+
+def table_to_frames(table):
+    '''
+    Returns the raw data dataframe and the lower-case dataframe of a snapshot table.
+
+    Strings stay in Arrow buffers instead of one Python object per cell. Only the columns in 
+    LOWER_COLUMNS have a lower-case copy, the other columns of df_lower are the columns of df. 
+    Rows are in the same order in both dataframes.
+
+            Parameters:
+                    table (Table): snapshot table, as written by write_snapshot
+
+            Returns:
+                    df (DataFrame): raw data dataframe
+                    df_lower (DataFrame): lower-case dataframe
+    '''
+    string_dtype = {pa.string(): pd.StringDtype('pyarrow')}.get
+    lower_columns = ['lower_' + col for col in LOWER_COLUMNS]
+    columns = [col for col in table.column_names if col not in lower_columns]
+    df = table.select(columns).to_pandas(types_mapper=string_dtype)
+    df_lower = table.select(lower_columns).to_pandas(types_mapper=string_dtype)
+    df_lower.columns = LOWER_COLUMNS
+    for col in columns:
+        if col not in LOWER_COLUMNS:
+            df_lower[col] = df[col]
+    df_lower = df_lower[columns]
     return df, df_lower
 
 
-def create_df_keywords(keywords_input, df_lower):
+def load_table(file_path, start=None, check=True):
     '''
-    Returns a dataframe with only rows that contain at least one of the keywords entered by user.
+    Returns the snapshot table of a raw data file, with the appended batches.
+
+    The snapshot is (re)written first if it does not exist or if the checksum of file_path 
+    changed. Tables are memory-mapped.
 
             Parameters:
-                    keywords_input (list): list of keywords entered by user
+                    file_path (str): path to raw data
+                    start (int): if given, only the batches after the first start 
+                                 batches, without the snapshot of file_path itself
+                    check (bool): whether to compare the checksums of file_path and of 
+                                  its snapshot first
+
+            Returns:
+                    table (Table): articles, None if there is no new batch after start
+                    version (int): number of batches appended to file_path
+    '''
+    path = snapshot_path(file_path)
+    if start is None and check:
+        checksum = file_checksum(file_path)
+        if snapshot_checksum(path) != checksum:
+            write_snapshot(file_path, checksum)
+    batches = read_manifest(file_path)
+    paths = [path] + batches if start is None else batches[start:]
+    if not paths:
+        return None, len(batches)
+    schema = feather.read_table(path, memory_map=True).schema
+    # Batches may have inferred other types for empty columns
+    tables = [feather.read_table(path, memory_map=True).cast(schema) for path in paths]
+    return pa.concat_tables(tables), len(batches)
+
+
+@timed
+def load_data(file_path):
+    '''
+    Returns dataframe with raw data and a dataframe with lower case.
+
+    Data is read from the columnar snapshot of file_path and the batches appended with 
+    append_articles, see load_table and table_to_frames.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    df (DataFrame): raw data dataframe
                     df_lower (DataFrame): lower-case dataframe
+    '''
+    table, _ = load_table(file_path)
+    return table_to_frames(table)
+
+
+def tokens_path(file_path):
+    '''
+    Returns the path of the tokenized articles of a raw data file, written with write_tokens.
+
+            Parameters:
+                    file_path (str): path to raw data
 
             Returns:
-                    input_df (DataFrame)
+                    path (Path): raw data path with a .tokens.feather extension
     '''
-    keywords_input = keywords_input.lower()
-    keywords_list = [word.strip() for word in keywords_input.split(',')]
-    input_df = df_lower[df_lower.Text.str.contains('|'.join(keywords_list))==True]
-    return input_df
+    return Path(file_path).with_suffix('.tokens.feather')
 
 
-def dates_article(df):
+def vocabulary_path(file_path):
     '''
-    Returns a dictionary with relevant dates related to the articles.
-    
-    Dictionary contains: date_max (last date of publication of an article containing at least one keyword), max_time_between_articles (maximal amount of time between articles), popular_month_year (month and year with most articles) and popular_year (most popular year).
+    Returns the path of the vocabulary of the tokenized articles of a raw data file.
 
             Parameters:
-                    df (DataFrame): dataframe containing articles
+                    file_path (str): path to raw data
 
             Returns:
-                    dictionary
+                    path (Path): raw data path with a .vocabulary.feather extension
     '''
-    df.reset_index(inplace=True, drop=True)
-    def date_max(df):
-        date_max = df.Date.max().strftime("%A, %d-%B-%Y")
-        return {'date_max':date_max}
-
-    def max_time_between_articles(df):    
-        df['time_between'] = df["Date"].diff()
-        max_time_between = df.time_between.max()
-        index_max = df[df['time_between']==max_time_between].index.tolist()
-        return {'max_time_between': f"{max_time_between.days} days", 
-                'date_of_publication':df.loc[[index_max[0]]]['Date'].item().strftime("%A, %d-%B-%Y"), 
-                'date_previous_publication':df.loc[[index_max[0]-1]]['Date'].item().strftime("%A, %d-%B-%Y")}
-    
-    def popular_month_year(df):
-        month_year_row = df.groupby([pd.to_datetime(df['Date']).dt.year,
-                           pd.to_datetime(df['Date']).dt.month]).Link.nunique().to_frame()
-        max_month_year = month_year_row[month_year_row.Link==month_year_row.Link.max()].index.to_list()
-        return {'month_year': f"{calendar.month_name[max_month_year[0][1]]} {max_month_year[0][0]}"}
-    
-    def popular_year(df):
-        years = df.groupby(pd.to_datetime(df['Date']).dt.year).Link.nunique().to_frame()
-        year = years[years.Link==years.Link.max()].index
-        if len(year) == 1:
-            return {'year': year.item()}
-        else:
-            return {'year': str(year.to_list())[1:-1]}
-    
-    df = df.sort_values(by=['Date'], ascending=True)
-    df = df.reset_index(drop=True)
-    return date_max(df) | max_time_between_articles(df) | popular_month_year(df) | popular_year(df)
-    
\ No newline at end of file
+    return Path(file_path).with_suffix('.vocabulary.feather')
+
+
+def positions_path(file_path):
+    '''
+    Returns the path of the postings and positions of the terms of the tokenized articles.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    path (Path): raw data path with a .positions.feather extension
+    '''
+    return Path(file_path).with_suffix('.positions.feather')
+
+
+def column_array(table, name):
+    '''
+    Returns a column of an Arrow table as a single array, without copy if it has a single chunk.
+    '''
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def matrix_arrays(matrix):
+    '''
+    Returns the rows of a csr_matrix as Arrow lists of column ids and of values, sharing offsets.
+
+            Parameters:
+                    matrix (csr_matrix): matrix to store
+
+            Returns:
+                    indices (ListArray): column ids of each row
+                    data (ListArray): values of each row
+    '''
+    # 32-bit offsets when possible, so that scipy reads the matrix back without upcasting the column ids
+    if matrix.nnz < 2 ** 31:
+        indptr, list_array = matrix.indptr.astype(np.int32), pa.ListArray
+    else:
+        indptr, list_array = matrix.indptr.astype(np.int64), pa.LargeListArray
+    return list_array.from_arrays(indptr, matrix.indices), list_array.from_arrays(indptr, matrix.data)
+
+
+def arrays_matrix(indices, data, n_cols):
+    '''
+    Returns the csr_matrix of Arrow lists written with matrix_arrays, without copy.
+
+            Parameters:
+                    indices (ListArray): column ids of each row
+                    data (ListArray): values of each row
+                    n_cols (int): number of columns
+
+            Returns:
+                    matrix (csr_matrix)
+    '''
+    return sparse.csr_matrix((data.values.to_numpy(), indices.values.to_numpy(), indices.offsets.to_numpy()),
+                             shape=(len(indices), n_cols), copy=False)
+
+
+def read_tokens(file_path):
+    '''
+    Returns the tokenized articles of a raw data file and the structures derived from them, 
+    written with write_tokens, memory-mapped.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    tokens (dict): vocabulary, encoded (tokens, offsets and separators of each column in 
+                                   LOWER_COLUMNS, see encode_columns), term_matrices and 
+                                   country_matrices by column, postings and positions of the Text 
+                                   column (see build_postings and build_positions), trends (see 
+                                   build_trend_cube) and version (batches tokenized); None if the files 
+                                   are missing or were written for another CSV or by an older version
+    '''
+    try:
+        tokens = feather.read_table(tokens_path(file_path), memory_map=True)
+        vocabulary = feather.read_table(vocabulary_path(file_path), memory_map=True)
+        positions = feather.read_table(positions_path(file_path), memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = tokens.schema.metadata or {}
+    checksum = snapshot_checksum(snapshot_path(file_path))
+    # The files must come from the same call of write_tokens
+    if (checksum is None or metadata != vocabulary.schema.metadata or metadata != positions.schema.metadata
+            or metadata.get(b'csv_sha256') != checksum.encode() or b'first_month' not in metadata):
+        return None
+    vocabulary = vocabulary.column('term').to_pylist()
+    encoded, term_matrices, country_matrices = {}, {}, {}
+    for col in LOWER_COLUMNS:
+        column, separators = column_array(tokens, col), column_array(tokens, 'separators_' + col)
+        encoded[col] = {'tokens': column.values.to_numpy(),
+                        'offsets': column.offsets.to_numpy(),
+                        'separators': separators.values.to_numpy(),
+                        'trailing': column_array(tokens, 'trailing_' + col).to_numpy()}
+        term_matrices[col] = arrays_matrix(column_array(tokens, 'terms_' + col), column_array(tokens, 'counts_' + col),
+                                           len(vocabulary))
+        country_matrices[col] = arrays_matrix(column_array(tokens, 'countries_' + col),
+                                              column_array(tokens, 'mentions_' + col), len(gazetteer()['countries']))
+    postings, entries = column_array(positions, 'postings'), column_array(positions, 'entries')
+    first_month, n_months = int(metadata[b'first_month']), int(metadata[b'months'])
+    return {'vocabulary': vocabulary,
+            'encoded': encoded,
+            'term_matrices': term_matrices,
+            'country_matrices': country_matrices,
+            'postings': {'postings_indptr': postings.offsets.to_numpy(), 'postings': postings.values.to_numpy()},
+            'positions': {'entries_indptr': entries.offsets.to_numpy(), 'entries': entries.values.to_numpy()},
+            'trends': {'counts': arrays_matrix(column_array(positions, 'trend_months'),
+                                               column_array(positions, 'trend_counts'), n_months),
+                       'months': np.arange(first_month, first_month + n_months).astype('datetime64[M]')},
+            'version': int(metadata[b'version'])}
+
+
+def write_tokens(file_path):
+    '''
+    Tokenizes the articles of a raw data file and writes them as term ids, with their vocabulary 
+    and the structures that build_corpus derives from them.
+
+    Each column in LOWER_COLUMNS is stored as an Arrow list of term ids per article: a flat 
+    int32 array with the offsets of the articles (CSR layout), in a single uncompressed chunk 
+    that read_tokens memory-maps, with the codes of the separators in the same layout 
+    (separators_ column) and after the last term of each article (trailing_ column). Term and 
+    country matrices are stored the same way, a list per article, and the postings, positions 
+    and trends of the Text column as lists per term of the vocabulary: the app memory-maps 
+    them all instead of building them when it starts. The CSV checksum and the number of 
+    batches are stored in the metadata of all the files. If batches were appended since the 
+    files were written, only the articles of these batches are tokenized.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    path (Path): path of the tokens
+    '''
+    table, version = load_table(file_path)
+    stored = read_tokens(file_path)
+    if stored is not None and stored['version'] == version:
+        return tokens_path(file_path)
+    df, df_lower = table_to_frames(table)
+    if stored is not None and stored['version'] < version:
+        new_table, _ = load_table(file_path, start=stored['version'])
+        new_vocabulary, new_encoded = encode_columns(table_to_frames(new_table)[1], LOWER_COLUMNS, separators=True)
+        vocabulary, ids, new_ids = merge_vocabularies(stored['vocabulary'], new_vocabulary)
+        encoded = merge_encoded(stored['encoded'], ids, new_encoded, new_ids)
+    else:
+        vocabulary, encoded = encode_columns(df_lower, LOWER_COLUMNS, separators=True)
+    term_matrices = {col: build_term_matrix(encoded[col], len(vocabulary)) for col in LOWER_COLUMNS}
+    trends = build_trend_cube(term_matrices['Text'], df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64))
+    months = trends['months'].astype(np.int64)
+    metadata = {b'csv_sha256': snapshot_checksum(snapshot_path(file_path)).encode(),
+                b'version': str(version).encode(),
+                b'first_month': str(months[0] if len(months) else 0).encode(),
+                b'months': str(len(months)).encode()}
+    columns = {}
+    for col in LOWER_COLUMNS:
+        offsets = encoded[col]['offsets']
+        columns[col] = pa.LargeListArray.from_arrays(offsets, encoded[col]['tokens'])
+        columns['separators_' + col] = pa.LargeListArray.from_arrays(offsets, encoded[col]['separators'])
+        columns['trailing_' + col] = pa.array(encoded[col]['trailing'])
+        columns['terms_' + col], columns['counts_' + col] = matrix_arrays(term_matrices[col])
+        columns['countries_' + col], columns['mentions_' + col] = matrix_arrays(
+            build_country_matrix(encoded[col], vocabulary))
+    postings = build_postings(term_matrices['Text'])
+    positions = build_positions(encoded['Text'], len(vocabulary))
+    positions = {'postings': pa.LargeListArray.from_arrays(postings['postings_indptr'].astype(np.int64),
+                                                           postings['postings']),
+                 'entries': pa.LargeListArray.from_arrays(positions['entries_indptr'], positions['entries'])}
+    positions['trend_months'], positions['trend_counts'] = matrix_arrays(trends['counts'])
+    write_feather(pa.table({'term': pa.array(vocabulary, type=pa.string())}).replace_schema_metadata(metadata),
+                  vocabulary_path(file_path))
+    write_feather(pa.table(positions).replace_schema_metadata(metadata), positions_path(file_path),
+                  chunksize=max(len(vocabulary), 1))
+    write_feather(pa.table(columns).replace_schema_metadata(metadata), tokens_path(file_path),
+                  chunksize=max(table.num_rows, 1))
+    return tokens_path(file_path)
+
+
+def encode_texts(texts, term_ids, separators=False):
+    '''
+    Returns the terms of some texts as term ids, in CSR layout: one flat array with the terms of 
+    all the texts and the offset of each text in it.
+
+            Parameters:
+                    texts (iterable): lower-case texts
+                    term_ids (dict): id of each term, new terms are added to it with the next id
+                    separators (bool): also return the codes of the texts between the terms
+
+            Returns:
+                    encoded (dict): tokens (int32 term ids) and offsets (int64, one more than texts); 
+                                    the terms of text i are tokens[offsets[i]:offsets[i + 1]]. With 
+                                    separators, also separators (uint8, one per token): code of the 
+                                    text before the term (see SEPARATORS), plus FIRST_TERM for the 
+                                    first term of a text, and trailing (uint8, one per text): code 
+                                    of the text after its last term
+    '''
+    tokens = array('i')
+    offsets = array('q', [0])
+    codes = array('B')
+    trailing = array('B')
+    for text in texts:
+        if separators:
+            parts = TOKEN_SPLIT_PATTERN.split(text)
+            terms = parts[1::2]
+            text_codes = [SEPARATOR_CODES.get(separator, 0) for separator in parts[:-1:2]]
+            if text_codes:
+                text_codes[0] |= FIRST_TERM
+            codes.extend(text_codes)
+            trailing.append(SEPARATOR_CODES.get(parts[-1], 0))
+        else:
+            terms = TOKEN_PATTERN.findall(text)
+        tokens.extend([term_ids.setdefault(term, len(term_ids)) for term in terms])
+        offsets.append(len(tokens))
+    encoded = {'tokens': np.frombuffer(tokens, dtype=np.int32), 'offsets': np.frombuffer(offsets, dtype=np.int64)}
+    if separators:
+        encoded['separators'] = np.frombuffer(codes, dtype=np.uint8)
+        encoded['trailing'] = np.frombuffer(trailing, dtype=np.uint8)
+    return encoded
+
+
+def encode_columns(df_lower, cols, separators=False):
+    '''
+    Returns the vocabulary of some columns and each column as ids of the terms in this vocabulary.
+
+    Texts are only tokenized here: term matrices, positions and country mentions are all 
+    computed from the term ids.
+
+            Parameters:
+                    df_lower (DataFrame): lower-case dataframe, or dictionary of lower-case texts by column
+                    cols (list): names of columns in df_lower
+                    separators (bool): also encode the texts between the terms, needed by build_index
+
+            Returns:
+                    vocabulary (list): sorted terms, shared by all columns
+                    encoded (dict): tokens and offsets (and separators) of each column, see encode_texts
+    '''
+    term_ids = {}
+    encoded = {col: encode_texts(df_lower[col], term_ids, separators) for col in cols}
+    # Sort the vocabulary and renumber the terms accordingly
+    vocabulary = sorted(term_ids)
+    new_ids = np.empty(len(vocabulary), dtype=np.int32)
+    new_ids[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary), dtype=np.int32)
+    return vocabulary, {col: {**part, 'tokens': new_ids[part['tokens']]} for col, part in encoded.items()}
+
+
+def merge_encoded(encoded, ids, new_encoded, new_ids):
+    '''
+    Returns encoded columns followed by the encoded columns of other texts, in a merged vocabulary.
+
+            Parameters:
+                    encoded (dict): tokens and offsets by column, created with encode_columns
+                    ids (array): id in the merged vocabulary of each term of encoded, see merge_vocabularies
+                    new_encoded (dict): tokens and offsets of the other texts, with the same columns
+                    new_ids (array): id in the merged vocabulary of each term of new_encoded
+
+            Returns:
+                    encoded (dict): tokens and offsets (and separators, if both have them) by column
+    '''
+    merged = {}
+    for col, part in encoded.items():
+        new_part = new_encoded[col]
+        merged[col] = {'tokens': np.concatenate([ids[part['tokens']], new_ids[new_part['tokens']]]),
+                       'offsets': np.concatenate([part['offsets'], new_part['offsets'][1:] + part['offsets'][-1]])}
+        for key in ('separators', 'trailing'):
+            if key in part and key in new_part:
+                merged[col][key] = np.concatenate([part[key], new_part[key]])
+    return merged
+
+
+def build_term_matrix(encoded, n_terms, chunksize=1 << 20):
+    '''
+    Returns the number of times each term appears in each text of an encoded column.
+
+            Parameters:
+                    encoded (dict): tokens and offsets of a column, created with encode_columns
+                    n_terms (int): size of the vocabulary
+                    chunksize (int): about how many tokens are counted at a time
+
+            Returns:
+                    term_matrix (csr_matrix): one row per text and one column per term of the vocabulary
+    '''
+    tokens, offsets = encoded['tokens'], encoded['offsets']
+    # Texts are counted a few at a time, so that temporary arrays stay small
+    bounds = np.unique(np.concatenate([[0], np.searchsorted(offsets, np.arange(chunksize, offsets[-1], chunksize)),
+                                       [len(offsets) - 1]]))
+    parts = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        part_offsets = offsets[start:end + 1] - offsets[start]
+        # The tokens are already a CSR matrix with a 1 per term; copied, as they may be memory-mapped
+        part = sparse.csr_matrix((np.ones(part_offsets[-1], dtype=np.int32),
+                                  tokens[offsets[start]:offsets[end]], part_offsets),
+                                 shape=(end - start, n_terms), copy=True)
+        # Sums the repeated terms of a text, and sorts the terms
+        part.sum_duplicates()
+        parts.append(part)
+    if not parts:
+        return sparse.csr_matrix((len(offsets) - 1, n_terms), dtype=np.int32)
+    return sparse.vstack(parts, format='csr')
+
+
+def build_index(df_lower, col='Text', vocabulary=None, term_matrix=None, positions=None, encoded=None,
+                postings=None):
+    '''
+    Returns an inverted index of the terms in a column of the lower-case dataframe.
+
+    The index maps every term to the sorted positions of the rows containing it, and to its 
+    positions in the terms of all the rows. It also keeps the terms of the rows with their 
+    separators, to check what follows or precedes an occurrence. It is built once after 
+    load_data, or read from the files of write_tokens, and reused for every keyword lookup.
+
+            Parameters:
+                    df_lower (DataFrame): lower-case dataframe
+                    col (str): name of the column to index
+                    vocabulary (list): optional vocabulary created with encode_columns
+                    term_matrix (csr_matrix): term matrix of col for this vocabulary, built if not given
+                    positions (dict): positions of the terms of col for this vocabulary, 
+                                      created with build_positions if not given
+                    encoded (dict): tokens, offsets, separators and trailing of col for this vocabulary, 
+                                    needed if vocabulary is given
+                    postings (dict): postings of col for this vocabulary, created with build_postings 
+                                     from term_matrix if not given
+
+            Returns:
+                    index (dict): column, number of rows, vocabulary, postings, positions and the 
+                                  tokens, offsets, separators and trailing of the rows
+    '''
+    if vocabulary is None:
+        vocabulary, encoded_columns = encode_columns(df_lower, [col], separators=True)
+        encoded = encoded_columns[col]
+    if postings is None:
+        if term_matrix is None:
+            term_matrix = build_term_matrix(encoded, len(vocabulary))
+        postings = build_postings(term_matrix)
+    # All terms in a single UTF-8 string, so that substring lookups run over a numpy array
+    vocabulary_bytes = np.frombuffer('\n'.join(vocabulary).encode('utf-8'), dtype=np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(vocabulary_bytes == ord('\n')) + 1])
+    index = {'column': col,
+             'size': len(df_lower),
+             'vocabulary': vocabulary,
+             'vocabulary_bytes': vocabulary_bytes,
+             'starts': starts,
+             'tokens': encoded['tokens'],
+             'offsets': encoded['offsets'],
+             'separators': encoded['separators'],
+             'trailing': encoded['trailing'],
+             **postings}
+    index.update(positions if positions is not None else build_positions(encoded, len(vocabulary)))
+    return index
+
+
+def build_postings(term_matrix):
+    '''
+    Returns the sorted rows containing each term of a term matrix.
+
+            Parameters:
+                    term_matrix (csr_matrix): term matrix created with build_term_matrix
+
+            Returns:
+                    postings (dict): postings_indptr and postings; the rows of term t are 
+                                     postings[postings_indptr[t]:postings_indptr[t + 1]]
+    '''
+    # The postings of a term are the (sorted) rows of its column
+    by_term = term_matrix.tocsc()
+    by_term.sort_indices()
+    return {'postings_indptr': by_term.indptr, 'postings': by_term.indices}
+
+
+def build_positions(encoded, n_terms, chunksize=1 << 20):
+    '''
+    Returns the positions of every term in the tokens of an encoded column, grouped by term.
+
+    For term t, entries entries_indptr[t] to entries_indptr[t + 1] are the sorted positions 
+    in encoded['tokens'] where t appears; the row of a position is given by the offsets. They 
+    are sorted by term with a counting sort, a chunk of tokens at a time, so that temporary 
+    arrays stay small.
+
+            Parameters:
+                    encoded (dict): tokens and offsets of a column, created with encode_columns
+                    n_terms (int): size of the vocabulary
+                    chunksize (int): number of tokens sorted at a time
+
+            Returns:
+                    positions (dict): entries_indptr and entries (int32 if there are less than 2**31 tokens)
+    '''
+    tokens = encoded['tokens']
+    entries_indptr = np.concatenate([[0], np.cumsum(np.bincount(tokens, minlength=n_terms))])
+    entries = np.empty(len(tokens), dtype=np.int32 if len(tokens) < 2 ** 31 else np.int64)
+    # First free entry of each term
+    following = entries_indptr[:-1].copy()
+    for start in range(0, len(tokens), chunksize):
+        chunk = tokens[start:start + chunksize]
+        order = np.argsort(chunk, kind='stable').astype(entries.dtype)
+        terms = chunk[order]
+        # Rank of each token among the tokens of the same term in the chunk
+        ranks = np.arange(len(terms)) - np.searchsorted(terms, terms)
+        entries[following[terms] + ranks] = order + start
+        following += np.bincount(chunk, minlength=n_terms)
+    return {'entries_indptr': entries_indptr, 'entries': entries}
+
+
+def term_postings(index, term_id):
+    '''
+    Returns the sorted positions of the rows containing a term.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    term_id (int): position of the term in the index vocabulary
+
+            Returns:
+                    rows (array)
+    '''
+    indptr = index['postings_indptr']
+    return index['postings'][indptr[term_id]:indptr[term_id + 1]]
+
+
+def find_bytes(data, pattern):
+    '''
+    Returns the positions of all the occurrences of a pattern in an array of bytes.
+
+            Parameters:
+                    data (array): uint8 array
+                    pattern (bytes): bytes to look for, not empty
+
+            Returns:
+                    positions (array): sorted positions in data
+    '''
+    if len(pattern) > len(data):
+        return np.array([], dtype=np.int64)
+    pattern = np.frombuffer(pattern, dtype=np.uint8)
+    positions = np.flatnonzero(data[:len(data) - len(pattern) + 1] == pattern[0])
+    for shift in range(1, len(pattern)):
+        positions = positions[data[positions + shift] == pattern[shift]]
+    return positions
+
+
+def matching_terms(index, word, start=False, end=False):
+    '''
+    Returns the ids of all terms in the index vocabulary that contain a word, or start or end with it.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    word (str): lower-case word without separators
+                    start (bool): only the terms starting with word
+                    end (bool): only the terms ending with word (with start, only word itself)
+
+            Returns:
+                    term_ids (array): sorted term ids
+    '''
+    vocabulary = index['vocabulary']
+    if start:
+        # Terms starting with word are contiguous in the sorted vocabulary
+        first = bisect_left(vocabulary, word)
+        if end:
+            found = first < len(vocabulary) and vocabulary[first] == word
+            return np.arange(first, first + found)
+        return np.arange(first, bisect_left(vocabulary, word + '\U0010ffff', lo=first))
+    # UTF-8 is searched as bytes, a match always starts at a character
+    data = index['vocabulary_bytes']
+    pattern = word.encode('utf-8')
+    positions = find_bytes(data, pattern)
+    if end:
+        # Followed by the newline between two terms, or by the end of the last term
+        after = positions + len(pattern)
+        positions = positions[(after == len(data)) | (data[np.minimum(after, len(data) - 1)] == ord('\n'))]
+    return np.unique(np.searchsorted(index['starts'], positions, side='right') - 1)
+
+
+def group_entries(indptr, ids):
+    '''
+    Returns the positions of all the entries of some groups in an array grouped by term (CSR layout).
+
+            Parameters:
+                    indptr (array): entries of group t are indptr[t] to indptr[t + 1]
+                    ids (array): groups
+
+            Returns:
+                    entries (array): positions of the entries, group after group
+    '''
+    starts = indptr[ids].astype(np.int64)
+    lengths = indptr[ids + 1] - starts
+    # Position in the concatenation of the groups, moved to the start of its group
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def terms_rows(index, term_ids):
+    '''
+    Returns the rows containing at least one of some terms.
+
+    Postings are added from the most frequent term, and the other terms are skipped once every 
+    row is found: short words such as "a" are part of many terms, but a few common ones already 
+    match almost every row.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    term_ids (array): term ids
+
+            Returns:
+                    rows (array): sorted int32 row positions
+    '''
+    if len(term_ids) == 1:
+        return term_postings(index, term_ids[0])
+    indptr, postings = index['postings_indptr'], index['postings']
+    lengths = indptr[term_ids + 1] - indptr[term_ids]
+    order = np.argsort(-lengths, kind='stable')
+    term_ids, ends = term_ids[order], np.cumsum(lengths[order])
+    found = np.zeros(index['size'], dtype=bool)
+    start, budget = 0, index['size']
+    while start < len(term_ids):
+        # Next terms, about budget postings, twice more each time
+        done = ends[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(ends, done + budget, side='right')))
+        found[postings[group_entries(indptr, term_ids[start:end])]] = True
+        if found.all():
+            break
+        start, budget = end, 2 * budget
+    return np.flatnonzero(found).astype(np.int32)
+
+
+def allowed_separators(test, other=2):
+    '''
+    Returns which separator codes pass a test, as a lookup table by code.
+
+            Parameters:
+                    test (function): test of a separator (str)
+                    other (int): value for code 0, the separators outside of SEPARATORS
+
+            Returns:
+                    allowed (array): 1 where the separator passes, 0 where it does not, and other for 
+                                     code 0; 2 means that the text must be checked
+    '''
+    return np.array([other] + [int(test(separator)) for separator in SEPARATORS], dtype=np.int8)
+
+
+def check_sequences(index, groups, tables, anchor, entries):
+    '''
+    Returns which occurrences of a term start a sequence of terms, with allowed separators.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    groups (list): arrays of term ids, the i-th term must be in groups[i]
+                    tables (list): lookup tables by separator code with FIRST_TERM (see 
+                                   sequence_rows), None to skip a check
+                    anchor (int): group of the occurrences
+                    entries (array): positions of the occurrences in the tokens of the index
+
+            Returns:
+                    starts (array): positions of the first term of the sequences in the tokens
+                    unknown (array): True where the separators must be checked on the text
+    '''
+    offsets, tokens, codes = index['offsets'], index['tokens'], index['separators']
+    starts = entries.astype(np.int64) - anchor
+    starts = starts[(starts >= 0) & (starts + len(groups) <= len(tokens))]
+    member = np.zeros(len(index['vocabulary']), dtype=bool)
+    for position, ids in enumerate(groups):
+        if position != anchor:
+            member[:] = False
+            member[ids] = True
+            starts = starts[member[tokens[starts + position]]]
+    unknown = np.zeros(len(starts), dtype=bool)
+    # Sequences across two rows stop here, on the FIRST_TERM of the second row
+    for position, table in enumerate(tables[:-1]):
+        if table is not None:
+            passed = table[codes[starts + position]]
+            keep = passed > 0
+            starts, unknown = starts[keep], unknown[keep] | (passed[keep] == 2)
+    if tables[-1] is not None:
+        # After the last term: the separator of the next term, or the end of the row
+        after = starts + len(groups)
+        following = np.full(len(starts), FIRST_TERM, dtype=np.uint8)
+        following[after < len(tokens)] = codes[after[after < len(tokens)]]
+        ends = following >= FIRST_TERM
+        trailing = following & (FIRST_TERM - 1)
+        trailing[ends] = index['trailing'][np.searchsorted(offsets, starts[ends], side='right') - 1]
+        passed = tables[-1][trailing]
+        keep = passed > 0
+        starts, unknown = starts[keep], unknown[keep] | (passed[keep] == 2)
+    return starts, unknown
+
+
+def sequence_rows(index, groups, separators):
+    '''
+    Returns the rows where terms of some groups follow each other, with allowed separators.
+
+    The occurrences of the group with the fewest entries are read from the positional index, 
+    then the terms and separators around each of them from the tokens of the rows. Rows with many 
+    occurrences of a few terms are checked a few occurrences at a time until a sequence is found, 
+    so that common phrases stop after a few rounds.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    groups (list): arrays of term ids, the i-th term must be in groups[i]
+                    separators (list): one more than groups, the separators allowed before each term 
+                                       and after the last one (see allowed_separators), None for any
+
+            Returns:
+                    rows (array): sorted int32 rows where the terms follow each other
+                    unknown (array): sorted int32 other rows where they follow each other with 
+                                     separators outside of SEPARATORS, to check on the texts
+    '''
+    indptr, postings_indptr, offsets = index['entries_indptr'], index['postings_indptr'], index['offsets']
+    counts = [(indptr[ids + 1] - indptr[ids]).sum() for ids in groups]
+    anchor = int(np.argmin(counts))
+    ids = groups[anchor]
+    runs = (postings_indptr[ids + 1] - postings_indptr[ids]).sum()
+    # Lookup tables by code with FIRST_TERM: 1 if allowed, 2 if to check on the text. The terms 
+    # after the first one must not start a row, the separators before the first one are those of 
+    # the row if it starts it.
+    tables = []
+    for position, allowed in enumerate(separators):
+        if allowed is None and position in (0, len(groups)):
+            tables.append(None)
+            continue
+        table = np.zeros(2 * FIRST_TERM, dtype=np.int8)
+        table[:len(SEPARATORS) + 1] = 1 if allowed is None else allowed
+        if position == 0:
+            table[FIRST_TERM:FIRST_TERM + len(SEPARATORS) + 1] = allowed
+        tables.append(table)
+    found = np.zeros(index['size'], dtype=bool)
+    check = np.zeros(index['size'], dtype=bool)
+    entries = index['entries']
+
+    def add(occurrences):
+        starts, unknown = check_sequences(index, groups, tables, anchor, entries[occurrences])
+        rows = np.searchsorted(offsets, starts, side='right') - 1
+        found[rows[~unknown]] = True
+        check[rows[unknown]] = True
+
+    if len(ids) > 16 or counts[anchor] <= 8 * runs:
+        add(group_entries(indptr, ids))
+        return np.flatnonzero(found).astype(np.int32), np.flatnonzero(check & ~found).astype(np.int32)
+    # Runs of occurrences of a term in a row, checked a few occurrences at a time, twice more 
+    # each round, while their row is not found
+    starts, ends, rows = [], [], []
+    for term in ids:
+        term_rows = term_postings(index, term)
+        term_starts = indptr[term] + np.searchsorted(entries[indptr[term]:indptr[term + 1]], offsets[term_rows])
+        starts.append(term_starts)
+        ends.append(np.append(term_starts[1:], indptr[term + 1]))
+        rows.append(term_rows)
+    starts, ends, rows = np.concatenate(starts), np.concatenate(ends), np.concatenate(rows)
+    step = 1
+    while len(starts):
+        stops = np.minimum(starts + step, ends)
+        # Runs as groups of interleaved bounds
+        add(group_entries(np.stack([starts, stops], axis=1).ravel(), np.arange(0, 2 * len(starts), 2)))
+        keep = (stops < ends) & ~found[rows]
+        starts, ends, rows, step = stops[keep], ends[keep], rows[keep], 2 * step
+    return np.flatnonzero(found).astype(np.int32), np.flatnonzero(check & ~found).astype(np.int32)
+
+
+def keyword_rows(keyword, df_lower, index):
+    '''
+    Returns the positions of the rows whose indexed column contains a keyword.
+
+    A keyword is split into words like the texts. In a text containing it, the words are on 
+    consecutive positions: the first one ends a term (unless the keyword starts with a 
+    separator), the last one starts a term (unless it ends with a separator), the others are 
+    whole terms, and the separators between them are those of the keyword. All this is read 
+    from the index; texts are only read for separators outside of SEPARATORS.
+
+            Parameters:
+                    keyword (str): lower-case keyword, may contain several words
+                    df_lower (DataFrame): lower-case dataframe used to build the index
+                    index (dict): inverted index created with build_index
+
+            Returns:
+                    rows (array): sorted row positions
+    '''
+    if not keyword:
+        # An empty keyword is contained in every article
+        return np.arange(index['size'])
+    texts = df_lower[index['column']]
+    parts = TOKEN_SPLIT_PATTERN.split(keyword)
+    words, between = parts[1::2], parts[::2]
+    if not words:
+        return np.flatnonzero(texts.str.contains(keyword, regex=False).to_numpy(dtype=bool))
+    leading, trailing = between[0], between[-1]
+    if len(words) == 1 and not leading and not trailing:
+        return terms_rows(index, matching_terms(index, words[0]))
+    # After apostrophes only, the first word may also be inside a term (rock'n'roll contains 'n)
+    inside = bool(leading) and not leading.strip("'")
+    groups = [matching_terms(index, word, start=position > 0 or (bool(leading) and not inside),
+                             end=position < len(words) - 1 or bool(trailing))
+              for position, word in enumerate(words)]
+    separators = [allowed_separators(lambda separator: separator.endswith(leading)) if leading and not inside else None]
+    # A separator of the keyword in SEPARATORS can not be an unknown one
+    separators += [allowed_separators(separator.__eq__, 0 if separator in SEPARATOR_CODES else 2)
+                   for separator in between[1:-1]]
+    separators.append(allowed_separators(lambda separator: separator.startswith(trailing)) if trailing else None)
+    rows, unknown = sequence_rows(index, groups, separators)
+    if inside:
+        rows, unknown = np.array([], dtype=np.int32), np.union1d(rows, unknown)
+    if len(unknown):
+        unknown = unknown[texts.iloc[unknown].str.contains(keyword, regex=False).to_numpy(dtype=bool)]
+        rows = np.union1d(rows, unknown).astype(np.int32)
+    return rows
+
+
+def normalize_keywords(keywords_input):
+    '''
+    Returns the keywords entered by user in a canonical form: lower case, stripped, without duplicates and sorted.
+
+    Keyword inputs with the same normal form match the same articles.
+
+            Parameters:
+                    keywords_input (str): keywords entered by user, separated by commas
+
+            Returns:
+                    keywords (tuple)
+    '''
+    return tuple(sorted({word.strip() for word in keywords_input.lower().split(',')}))
+
+
+@timed
+def search_rows(keywords_input, df_lower, index):
+    '''
+    Returns the positions of the rows that contain at least one of the keywords entered by user.
+
+            Parameters:
+                    keywords_input (str): keywords entered by user, separated by commas
+                    df_lower (DataFrame): lower-case dataframe
+                    index (dict): inverted index of df_lower created with build_index
+
+            Returns:
+                    rows (array): sorted row positions, as int32
+    '''
+    keywords_input = keywords_input.lower()
+    keywords_list = [word.strip() for word in keywords_input.split(',')]
+    # Union of the postings of every keyword
+    rows = np.unique(np.concatenate([keyword_rows(keyword, df_lower, index) for keyword in keywords_list]))
+    return rows.astype(np.int32, copy=False)
+
+
+def contains_keywords(texts, keywords_input):
+    '''
+    Returns which texts contain at least one of the keywords entered by user, as literal 
+    substrings like search_rows, without an index.
+
+            Parameters:
+                    texts (Series): lower-case texts
+                    keywords_input (str): keywords entered by user, separated by commas
+
+            Returns:
+                    mask (array): boolean, one value per text
+    '''
+    mask = np.zeros(len(texts), dtype=bool)
+    for keyword in {word.strip() for word in keywords_input.lower().split(',')}:
+        mask |= texts.str.contains(keyword, regex=False, na=False).to_numpy(dtype=bool)
+    return mask
+
+
+@timed
+def create_df_keywords(keywords_input, df_lower, index=None):
+    '''
+    Returns a dataframe with only rows that contain at least one of the keywords entered by user.
+
+            Parameters:
+                    keywords_input (list): list of keywords entered by user
+                    df_lower (DataFrame): lower-case dataframe
+                    index (dict): optional inverted index of df_lower created with build_index
+
+            Returns:
+                    input_df (DataFrame)
+    '''
+    if index is None:
+        input_df = df_lower[contains_keywords(df_lower['Text'], keywords_input)]
+        return input_df
+    input_df = df_lower.iloc[search_rows(keywords_input, df_lower, index)]
+    return input_df
+
+
+# Quoted phrases, parentheses, or anything else up to a space, a parenthesis or a quote
+QUERY_TOKEN_PATTERN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+QUERY_OPERATORS = ('AND', 'OR', 'NOT', '(', ')')
+
+
+def rows_to_bits(rows, size):
+    '''
+    Returns a bitset (packed into uint8) with the bits of some rows set.
+
+            Parameters:
+                    rows (array): row positions
+                    size (int): number of rows
+
+            Returns:
+                    bits (array)
+    '''
+    mask = np.zeros(size, dtype=bool)
+    mask[rows] = True
+    return np.packbits(mask)
+
+
+def bits_to_rows(bits, size):
+    '''
+    Returns the sorted positions of the rows set in a bitset created with rows_to_bits.
+
+            Parameters:
+                    bits (array): bitset
+                    size (int): number of rows
+
+            Returns:
+                    rows (array): int32 row positions
+    '''
+    return np.flatnonzero(np.unpackbits(bits, count=size)).astype(np.int32)
+
+
+def term_id(index, term):
+    '''
+    Returns the position of a term in the index vocabulary, or None if the term is not in it.
+    '''
+    vocabulary = index['vocabulary']
+    position = bisect_left(vocabulary, term)
+    if position < len(vocabulary) and vocabulary[position] == term:
+        return position
+    return None
+
+
+def phrase_rows(index, terms):
+    '''
+    Returns the rows where some terms appear one after the other.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    terms (list): lower-case terms
+
+            Returns:
+                    rows (array): sorted row positions
+    '''
+    ids = [term_id(index, term) for term in terms]
+    if not ids or None in ids:
+        return np.array([], dtype=np.int32)
+    # Any separator between the terms, as long as they are in the same row
+    rows, _ = sequence_rows(index, [np.array([term]) for term in ids], [None] * (len(ids) + 1))
+    return rows
+
+
+def prefix_rows(index, prefix):
+    '''
+    Returns the rows containing a term that starts with a prefix.
+
+            Parameters:
+                    index (dict): inverted index created with build_index
+                    prefix (str): lower-case prefix
+
+            Returns:
+                    rows (array): sorted row positions
+    '''
+    vocabulary = index['vocabulary']
+    # Terms starting with prefix are contiguous in the sorted vocabulary
+    first = bisect_left(vocabulary, prefix)
+    last = bisect_left(vocabulary, prefix + '\U0010ffff', lo=first)
+    indptr = index['postings_indptr']
+    return np.unique(index['postings'][indptr[first]:indptr[last]])
+
+
+def parse_query(query):
+    '''
+    Returns the syntax tree of a boolean query.
+
+    Operators are AND, OR and NOT (upper case) and parentheses; terms next to each other without 
+    operator must all be present. Words between double quotes are a phrase, and a word ending 
+    with * is a prefix. NOT binds tighter than AND, which binds tighter than OR.
+
+            Parameters:
+                    query (str): query entered by user, e.g. "plant-based" AND (milk OR chees*) NOT oat
+
+            Returns:
+                    tree (tuple): ('or', [trees]), ('and', [trees]), ('not', tree), ('phrase', [terms]) 
+                                  or ('prefix', prefix)
+    '''
+    tokens = QUERY_TOKEN_PATTERN.findall(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        branches = [parse_and()]
+        while peek() == 'OR':
+            take()
+            branches.append(parse_and())
+        return branches[0] if len(branches) == 1 else ('or', branches)
+
+    def parse_and():
+        branches = [parse_not()]
+        while peek() is not None and peek() not in ('OR', ')'):
+            if peek() == 'AND':
+                take()
+            branches.append(parse_not())
+        return branches[0] if len(branches) == 1 else ('and', branches)
+
+    def parse_not():
+        if peek() == 'NOT':
+            take()
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = peek()
+        if token is None or token in QUERY_OPERATORS[:2] or token == ')':
+            raise ValueError(f'Expected a word, a phrase or "(" but found {token or "the end of the query"}.')
+        take()
+        if token == '(':
+            tree = parse_or()
+            if peek() != ')':
+                raise ValueError('Missing closing parenthesis.')
+            take()
+            return tree
+        if token.startswith('"'):
+            if len(token) < 2 or not token.endswith('"'):
+                raise ValueError('Missing closing double quote.')
+            terms = TOKEN_PATTERN.findall(token[1:-1].lower())
+        elif token.endswith('*'):
+            terms = TOKEN_PATTERN.findall(token[:-1].lower())
+            if len(terms) != 1:
+                raise ValueError(f'A wildcard applies to a single word, not to {token}.')
+            return ('prefix', terms[0])
+        else:
+            # Words with separators (plant-based) are phrases
+            terms = TOKEN_PATTERN.findall(token.lower())
+        if not terms:
+            # Such a phrase would match no article, and neither would the terms next to it
+            raise ValueError(f'{token} contains no word to search.')
+        return ('phrase', terms)
+
+    tree = parse_or()
+    if peek() is not None:
+        raise ValueError(f'Unexpected {peek()} in the query.')
+    return tree
+
+
+@timed
+def query_rows(query, index):
+    '''
+    Returns the positions of the rows matching a boolean query, see parse_query for the syntax.
+
+    Terms are matched as whole words. Intermediate results are bitsets over all the rows.
+
+            Parameters:
+                    query (str): query entered by user
+                    index (dict): inverted index created with build_index
+
+            Returns:
+                    rows (array): sorted int32 row positions
+    '''
+    size = index['size']
+
+    def evaluate(tree):
+        operator, operand = tree
+        if operator == 'phrase':
+            return rows_to_bits(phrase_rows(index, operand), size)
+        if operator == 'prefix':
+            return rows_to_bits(prefix_rows(index, operand), size)
+        if operator == 'not':
+            return ~evaluate(operand)
+        bits = [evaluate(branch) for branch in operand]
+        return np.bitwise_and.reduce(bits) if operator == 'and' else np.bitwise_or.reduce(bits)
+
+    return bits_to_rows(evaluate(parse_query(query)), size)
+
+
+@dataclass(frozen=True)
+class Corpus:
+    '''
+    Articles dataset and the structures derived from it, built once and shared read-only by all sessions.
+
+            Attributes:
+                    df (DataFrame): raw data dataframe
+                    df_lower (DataFrame): lower-case dataframe
+                    vocabulary (list): sorted terms of the articles' title and text
+                    terms_text (csr_matrix): term counts per article in the text
+                    terms_title (csr_matrix): term counts per article in the title
+                    index (dict): inverted index of the articles' text
+                    countries_text (csr_matrix): country mentions per article in the text
+                    countries_title (csr_matrix): country mentions per article in the title
+                    days (array): day of publication of each article, as int64 days since 1970-01-01
+                    trends (dict): articles per term and month in the text, created with build_trend_cube
+                    version (int): number of batches appended to the raw data, see append_articles
+    '''
+    df: pd.DataFrame
+    df_lower: pd.DataFrame
+    vocabulary: list
+    terms_text: sparse.csr_matrix
+    terms_title: sparse.csr_matrix
+    index: dict
+    countries_text: sparse.csr_matrix
+    countries_title: sparse.csr_matrix
+    days: np.ndarray
+    trends: dict
+    version: int = 0
+
+
+def freeze_corpus(corpus):
+    '''
+    Makes the arrays of a Corpus read-only: it is shared between threads, so no array may be 
+    modified in place.
+
+            Parameters:
+                    corpus (Corpus): corpus to freeze
+
+            Returns:
+                    corpus (Corpus): the same corpus
+    '''
+    corpus.days.setflags(write=False)
+    corpus.trends['months'].setflags(write=False)
+    for key in ('postings', 'postings_indptr', 'entries_indptr', 'entries', 'tokens', 'offsets', 'separators', 'trailing'):
+        corpus.index[key].setflags(write=False)
+    for matrix in (corpus.terms_text, corpus.terms_title, corpus.countries_text, corpus.countries_title,
+                   corpus.trends['counts']):
+        for array in (matrix.data, matrix.indices, matrix.indptr):
+            array.setflags(write=False)
+    return corpus
+
+
+@timed
+def build_corpus(file_path):
+    '''
+    Returns the read-only Corpus of a raw data file, with the batches appended to it.
+
+    The term matrices, the country matrices, the trends and the postings and positions of the 
+    index are memory-mapped from the files of write_tokens, which only tokenizes the texts if 
+    they are missing or out of date.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    corpus (Corpus)
+    '''
+    table, version = load_table(file_path)
+    # The articles are only tokenized if the tokens are missing or out of date
+    tokens = read_tokens(file_path)
+    if tokens is None or tokens['version'] != version:
+        write_tokens(file_path)
+        tokens = read_tokens(file_path)
+    return mapped_corpus(table, tokens)
+
+
+def mapped_corpus(table, tokens):
+    '''
+    Returns the read-only Corpus of a snapshot table and of its tokens, memory-mapped.
+
+            Parameters:
+                    table (Table): articles, with the appended batches (see load_table)
+                    tokens (dict): tokens of the same articles (see read_tokens)
+
+            Returns:
+                    corpus (Corpus)
+    '''
+    df, df_lower = table_to_frames(table)
+    vocabulary, term_matrices, country_matrices = tokens['vocabulary'], tokens['term_matrices'], tokens['country_matrices']
+    corpus = Corpus(df=df,
+                    df_lower=df_lower,
+                    vocabulary=vocabulary,
+                    terms_text=term_matrices['Text'],
+                    terms_title=term_matrices['Title'],
+                    index=build_index(df_lower, 'Text', vocabulary, positions=tokens['positions'],
+                                      encoded=tokens['encoded']['Text'], postings=tokens['postings']),
+                    countries_text=country_matrices['Text'],
+                    countries_title=country_matrices['Title'],
+                    days=df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64),
+                    trends=tokens['trends'],
+                    version=tokens['version'])
+    return freeze_corpus(corpus)
+
+
+def merge_vocabularies(vocabulary, new_vocabulary):
+    '''
+    Returns the union of two sorted vocabularies and where the terms of each one moved.
+
+    Ids only move forward and keep their order, so sorted term ids stay sorted once mapped.
+
+            Parameters:
+                    vocabulary (list): sorted terms
+                    new_vocabulary (list): sorted terms
+
+            Returns:
+                    merged (list): sorted terms of both vocabularies
+                    ids (array): id in merged of each term of vocabulary
+                    new_ids (array): id in merged of each term of new_vocabulary
+    '''
+    inserts = [bisect_left(vocabulary, term) for term in new_vocabulary]
+    is_new = np.array([insert == len(vocabulary) or vocabulary[insert] != term
+                       for insert, term in zip(inserts, new_vocabulary)], dtype=bool)
+    inserts = np.array(inserts, dtype=np.int64)
+    added = inserts[is_new]
+    # A term moves forward by the number of added terms sorted before it
+    ids = np.arange(len(vocabulary)) + np.searchsorted(added, np.arange(len(vocabulary)), side='right')
+    new_ids = np.empty(len(new_vocabulary), dtype=np.int64)
+    new_ids[is_new] = added + np.arange(len(added))
+    new_ids[~is_new] = ids[inserts[~is_new]]
+    merged = [None] * (len(vocabulary) + len(added))
+    for term, term_id in zip(vocabulary, ids):
+        merged[term_id] = term
+    for term, term_id, new in zip(new_vocabulary, new_ids, is_new):
+        if new:
+            merged[term_id] = term
+    return merged, ids.astype(np.int32), new_ids.astype(np.int32)
+
+
+def remap_columns(matrix, ids, n_cols):
+    '''
+    Returns a csr_matrix with its column ids replaced by ids[column], which must be increasing.
+
+            Parameters:
+                    matrix (csr_matrix): matrix to remap
+                    ids (array): new id of each column
+                    n_cols (int): number of columns of the new matrix
+
+            Returns:
+                    matrix (csr_matrix)
+    '''
+    return sparse.csr_matrix((matrix.data, ids[matrix.indices], matrix.indptr), shape=(matrix.shape[0], n_cols))
+
+
+def merge_groups(indptr, ids, new_indptr, new_ids, n_terms):
+    '''
+    Returns where the entries of two arrays grouped by term (CSR layout) go when they are merged, 
+    the entries of a term in the first array before those in the second one.
+
+            Parameters:
+                    indptr (array): entries of term t are indptr[t] to indptr[t + 1] in the first array
+                    ids (array): id in the merged vocabulary of each term of the first array
+                    new_indptr (array): same for the second array
+                    new_ids (array): id in the merged vocabulary of each term of the second array
+                    n_terms (int): size of the merged vocabulary
+
+            Returns:
+                    indptr (array): entries of each term in the merged array
+                    destinations (array): position in the merged array of each entry of the first array
+                    new_destinations (array): same for the second array
+    '''
+    counts = np.zeros(n_terms, dtype=np.int64)
+    counts[ids] = np.diff(indptr)
+    new_counts = np.zeros(n_terms, dtype=np.int64)
+    new_counts[new_ids] = np.diff(new_indptr)
+    merged_indptr = np.concatenate([[0], np.cumsum(counts + new_counts)])
+    destinations = []
+    for part_indptr, part_ids, start in ((indptr, ids, merged_indptr[:-1]),
+                                         (new_indptr, new_ids, merged_indptr[:-1] + counts)):
+        lengths = np.diff(part_indptr)
+        terms = np.repeat(part_ids, lengths)
+        destinations.append(start[terms] + np.arange(part_indptr[-1]) - np.repeat(part_indptr[:-1], lengths))
+    return merged_indptr, destinations[0], destinations[1]
+
+
+def merge_postings(index, ids, new_index, new_ids, n_terms, offset):
+    '''
+    Returns the postings of existing rows followed by rows appended to them, without rebuilding 
+    them from the term matrix.
+
+            Parameters:
+                    index (dict): index of the existing rows, created with build_index
+                    ids (array): id in the merged vocabulary of each term of index
+                    new_index (dict): postings_indptr and postings of the appended rows
+                    new_ids (array): id in the merged vocabulary of each term of new_index
+                    n_terms (int): size of the merged vocabulary
+                    offset (int): number of existing rows
+
+            Returns:
+                    postings (dict): postings_indptr and postings
+    '''
+    indptr, destinations, new_destinations = merge_groups(index['postings_indptr'], ids, new_index['postings_indptr'],
+                                                          new_ids, n_terms)
+    postings = np.empty(indptr[-1], dtype=index['postings'].dtype)
+    postings[destinations] = index['postings']
+    postings[new_destinations] = new_index['postings'] + offset
+    return {'postings_indptr': indptr, 'postings': postings}
+
+
+def merge_positions(positions, ids, new_positions, new_ids, n_terms, offset):
+    '''
+    Returns the positions of the terms in existing rows followed by rows appended to them.
+
+            Parameters:
+                    positions (dict): positions of the existing rows, created with build_positions
+                    ids (array): id in the merged vocabulary of each term of positions
+                    new_positions (dict): positions of the appended rows
+                    new_ids (array): id in the merged vocabulary of each term of new_positions
+                    n_terms (int): size of the merged vocabulary
+                    offset (int): number of tokens of the existing rows
+
+            Returns:
+                    positions (dict): entries_indptr and entries
+    '''
+    # Entries of a term: existing rows first, then the appended rows, both already sorted
+    entries_indptr, destinations, new_destinations = merge_groups(positions['entries_indptr'], ids,
+                                                                  new_positions['entries_indptr'], new_ids, n_terms)
+    entries = np.empty(entries_indptr[-1], dtype=np.int32 if entries_indptr[-1] < 2 ** 31 else np.int64)
+    entries[destinations] = positions['entries']
+    entries[new_destinations] = new_positions['entries'].astype(entries.dtype) + offset
+    return {'entries_indptr': entries_indptr, 'entries': entries}
+
+
+def merge_trend_cubes(cube, ids, new_cube, new_ids, n_terms):
+    '''
+    Returns the sum of two trend cubes, with their terms mapped to a merged vocabulary.
+
+            Parameters:
+                    cube (dict): trend cube created with build_trend_cube
+                    ids (array): id in the merged vocabulary of each term of cube
+                    new_cube (dict): trend cube of other articles
+                    new_ids (array): id in the merged vocabulary of each term of new_cube
+                    n_terms (int): size of the merged vocabulary
+
+            Returns:
+                    cube (dict): counts and months
+    '''
+    month_ranges = [part['months'].astype(np.int64) for part in (cube, new_cube) if len(part['months'])]
+    if not month_ranges:
+        return {'counts': sparse.csr_matrix((n_terms, 0), dtype=cube['counts'].dtype), 'months': cube['months']}
+    first_month = min(months[0] for months in month_ranges)
+    last_month = max(months[-1] for months in month_ranges)
+    rows, cols, data = [], [], []
+    for part, part_ids in ((cube, ids), (new_cube, new_ids)):
+        if len(part['months']):
+            counts = part['counts'].tocoo()
+            rows.append(part_ids[counts.row])
+            cols.append(counts.col + int(part['months'][0].astype(np.int64) - first_month))
+            data.append(counts.data)
+    # Terms present in both cubes for the same month are summed when converting to CSR
+    counts = sparse.coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                               shape=(n_terms, int(last_month - first_month + 1))).tocsr()
+    return {'counts': counts,
+            'months': np.arange(first_month, last_month + 1).astype('datetime64[M]')}
+
+
+def extend_corpus(corpus, df, df_lower, version):
+    '''
+    Returns a new Corpus with articles appended to an existing one, which is left unchanged.
+
+    Only the new articles are tokenized and searched for countries. The structures of the 
+    existing articles are renumbered for the merged vocabulary and concatenated, without 
+    reading their texts again; postings and positions are merged term by term. Concatenating 
+    still copies the existing arrays and dataframes once, so an append costs a memory copy 
+    of the corpus on top of the work on the new articles.
+
+            Parameters:
+                    corpus (Corpus): existing corpus
+                    df (DataFrame): raw data dataframe of the new articles
+                    df_lower (DataFrame): lower-case dataframe of the new articles
+                    version (int): version of the new corpus
+
+            Returns:
+                    corpus (Corpus)
+    '''
+    new_vocabulary, encoded = encode_columns(df_lower, LOWER_COLUMNS, separators=True)
+    term_matrices = {col: build_term_matrix(encoded[col], len(new_vocabulary)) for col in LOWER_COLUMNS}
+    vocabulary, ids, new_ids = merge_vocabularies(corpus.vocabulary, new_vocabulary)
+    n_terms = len(vocabulary)
+    terms = {}
+    for col, matrix in (('Text', corpus.terms_text), ('Title', corpus.terms_title)):
+        terms[col] = sparse.vstack([remap_columns(matrix, ids, n_terms),
+                                    remap_columns(term_matrices[col], new_ids, n_terms)], format='csr')
+    days = df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    all_df = pd.concat([corpus.df, df], ignore_index=True)
+    all_df_lower = pd.concat([corpus.df_lower, df_lower], ignore_index=True)
+    positions = merge_positions(corpus.index, ids, build_positions(encoded['Text'], len(new_vocabulary)), new_ids,
+                                n_terms, len(corpus.index['tokens']))
+    postings = merge_postings(corpus.index, ids, build_postings(term_matrices['Text']), new_ids, n_terms, len(corpus.df))
+    tokens = {key: corpus.index[key] for key in ('tokens', 'offsets', 'separators', 'trailing')}
+    tokens = merge_encoded({'Text': tokens}, ids, {'Text': encoded['Text']}, new_ids)['Text']
+    trends = merge_trend_cubes(corpus.trends, ids, build_trend_cube(term_matrices['Text'], days), new_ids, n_terms)
+    extended = Corpus(df=all_df,
+                      df_lower=all_df_lower,
+                      vocabulary=vocabulary,
+                      terms_text=terms['Text'],
+                      terms_title=terms['Title'],
+                      index=build_index(all_df_lower, 'Text', vocabulary, terms['Text'], positions, tokens, postings),
+                      countries_text=sparse.vstack([corpus.countries_text,
+                                                    build_country_matrix(encoded['Text'], new_vocabulary)], format='csr'),
+                      countries_title=sparse.vstack([corpus.countries_title,
+                                                     build_country_matrix(encoded['Title'], new_vocabulary)], format='csr'),
+                      days=np.concatenate([corpus.days, days]),
+                      trends=trends,
+                      version=version)
+    return freeze_corpus(extended)
+
+
+@timed
+def refresh_corpus(corpus, file_path):
+    '''
+    Returns the Corpus of a raw data file with the batches appended since corpus was built.
+
+    The corpus is returned as is if there is no new batch. It is rebuilt if there are fewer 
+    batches than when it was built, which happens when the snapshot of file_path is rewritten.
+    If the new batches were already tokenized (ingest.py does it right after appending them), 
+    the corpus is memory-mapped again from the files of write_tokens; otherwise the new 
+    articles are tokenized and merged in memory.
+
+            Parameters:
+                    corpus (Corpus): corpus of file_path
+                    file_path (str): path to raw data
+
+            Returns:
+                    corpus (Corpus)
+    '''
+    table, version = load_table(file_path, start=corpus.version)
+    if version < corpus.version:
+        return build_corpus(file_path)
+    if table is None:
+        return corpus
+    tokens = read_tokens(file_path)
+    if tokens is not None and tokens['version'] == version:
+        full_table, full_version = load_table(file_path, check=False)
+        # Another batch may have been appended in between
+        if full_version == version:
+            return mapped_corpus(full_table, tokens)
+    df, df_lower = table_to_frames(table)
+    return extend_corpus(corpus, df, df_lower, version)
+
+
+@timed
+def date_stats(days, counts=None):
+    '''
+    Returns a dictionary with relevant dates related to the articles, from their days of publication.
+
+    All statistics come from one pass over the distinct days, so per-day counts can be given 
+    instead of one day per article.
+
+            Parameters:
+                    days (array): days of publication as int64 days since 1970-01-01, 
+                                  in any order; sorted and distinct if counts is given
+                    counts (array): optional number of articles published each day
+
+            Returns:
+                    dictionary: same keys as dates_article
+    '''
+    days = np.asarray(days, dtype=np.int64)
+    if counts is None:
+        days, counts = np.unique(days, return_counts=True)
+    if len(days) == 0:
+        raise ValueError('No articles to compute date stats from.')
+    dates = days.astype('datetime64[D]')
+    def format_day(day):
+        return pd.Timestamp(day).strftime("%A, %d-%B-%Y")
+    # Largest gap between consecutive days with articles (the first one if several)
+    gaps = np.diff(days, prepend=days[0])
+    after = int(np.argmax(gaps))
+    before = max(after - 1, 0)
+    # Articles per month and per year since the first one
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    per_month = np.bincount(months - months[0], weights=counts)
+    popular_month = np.datetime64(int(months[0] + np.argmax(per_month)), 'M').astype(object)
+    years = dates.astype('datetime64[Y]').astype(np.int64)
+    per_year = np.bincount(years - years[0], weights=counts)
+    popular_years = (years[0] + 1970 + np.flatnonzero(per_year == per_year.max())).tolist()
+    return {'date_max': format_day(dates[-1]),
+            'max_time_between': f"{gaps[after]} days",
+            'date_of_publication': format_day(dates[after]),
+            'date_previous_publication': format_day(dates[before]),
+            'month_year': f"{calendar.month_name[popular_month.month]} {popular_month.year}",
+            'year': popular_years[0] if len(popular_years) == 1 else str(popular_years)[1:-1]}
+
+
+@timed
+def dates_article(df):
+    '''
+    Returns a dictionary with relevant dates related to the articles.
+    
+    Dictionary contains: date_max (last date of publication of an article containing at least one keyword), max_time_between_articles (maximal amount of time between articles), popular_month_year (month and year with most articles) and popular_year (most popular year).
+    The dataframe is not modified.
+
+            Parameters:
+                    df (DataFrame): dataframe containing articles
+
+            Returns:
+                    dictionary
+    '''
+    days = df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return date_stats(days)
+
+
+def count_days(df):
+    '''
+    Returns the number of articles published each day, to merge the date stats of several batches.
+
+            Parameters:
+                    df (DataFrame): dataframe containing articles
+
+            Returns:
+                    day_counts (Counter): number of articles by int64 day since 1970-01-01
+    '''
+    days, counts = np.unique(df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int64), return_counts=True)
+    return Counter(dict(zip(days.tolist(), counts.tolist())))
+
+
+def iter_chunks(file_path, chunksize=50000):
+    '''
+    Yields the raw data in batches of rows, without loading the whole file.
+
+            Parameters:
+                    file_path (str): path to raw data
+                    chunksize (int): number of rows per batch
+
+            Yields:
+                    df (DataFrame): raw data of the batch, indexed by row position in the file
+                    df_lower (DataFrame): same batch with the columns in LOWER_COLUMNS in lower case
+    '''
+    for df in pd.read_csv(file_path, chunksize=chunksize):
+        df['Date'] = pd.to_datetime(df['Date'], format="%m/%d/%Y")
+        df_lower = df.assign(**{col: df[col].astype(str).str.lower() for col in LOWER_COLUMNS})
+        yield df, df_lower
+
+
+def stream_analysis(chunks, keywords_input, col='Text', workers=1):
+    '''
+    Returns the keyword, country and date analyses of a corpus read in batches.
+
+    Each batch is filtered with create_df_keywords, matching keywords as literal text like 
+    the app, then only partial aggregates are kept and merged (country mentions and articles 
+    per day), so memory depends on the batch size and not on the corpus size. With several 
+    workers, each batch is filtered and its countries counted by a ParallelScanner, sharded 
+    over a pool of processes started once for all the batches.
+
+            Parameters:
+                    chunks (iterable): (df, df_lower) batches, e.g. from iter_chunks
+                    keywords_input (str): keywords entered by user, separated by commas
+                    col (str): column in which countries are counted
+                    workers (int): number of processes, all the CPUs if None; 1 scans in the 
+                                   current process
+
+            Returns:
+                    analysis (dict): articles (number of matching articles), countries (as returned 
+                                     by create_df_countries) and dates (as returned by date_stats, 
+                                     None if no article matches)
+    '''
+    return stream_analyses(chunks, [keywords_input], col, workers)[0]
+
+
+def stream_analyses(chunks, keyword_sets, col='Text', workers=1):
+    '''
+    Returns the analyses of many keyword sets over a corpus read once in batches, see stream_analysis.
+
+    Every keyword set is evaluated on each batch, with a running total per set.
+
+            Parameters:
+                    chunks (iterable): (df, df_lower) batches, e.g. from iter_chunks
+                    keyword_sets (list): keywords entered by user, separated by commas, one string per set
+                    col (str): column in which countries are counted
+                    workers (int): number of processes, all the CPUs if None; 1 scans in the 
+                                   current process
+
+            Returns:
+                    analyses (list): analysis of each keyword set, as returned by stream_analysis
+    '''
+    totals = [{'articles': 0, 'countries': Counter(), 'days': Counter()} for _ in keyword_sets]
+    if workers == 1:
+        scanner = nullcontext()
+    else:
+        # Imported here, parallel imports this module
+        from parallel import ParallelScanner
+        # Each batch is loaded into the same pool
+        scanner = ParallelScanner([], workers)
+    with scanner:
+        for _, df_lower in chunks:
+            if workers != 1:
+                scanner.load(df_lower['Text'])
+            for keywords_input, total in zip(keyword_sets, totals):
+                if workers == 1:
+                    input_df = create_df_keywords(keywords_input, df_lower)
+                    counts = count_countries(input_df[col].astype(str))
+                else:
+                    rows, counts = scanner.scan(keywords_input, count=col == 'Text')
+                    input_df = df_lower.iloc[rows]
+                    if col != 'Text':
+                        counts = count_countries(input_df[col].astype(str))
+                total['articles'] += len(input_df)
+                total['countries'].update(counts)
+                total['days'].update(count_days(input_df))
+    analyses = []
+    for total in totals:
+        days = np.array(sorted(total['days']), dtype=np.int64)
+        counts = np.array([total['days'][day] for day in days.tolist()], dtype=np.int64)
+        analyses.append({'articles': total['articles'],
+                         'countries': create_df_countries(None, col, counts=total['countries']),
+                         'dates': date_stats(days, counts) if total['articles'] else None})
+    return analyses
+
+
+def csv_gzip_chunks(chunks):
+    '''
+    Yields a gzip-compressed CSV file of dataframes, piece by piece.
+
+    Each dataframe is converted and compressed on its own, so memory only holds one chunk at 
+    a time, whatever the number of rows.
+
+            Parameters:
+                    chunks (iterable): dataframes with the same columns, e.g. articles read by row ids
+
+            Returns:
+                    pieces (generator): bytes of the gzip file, to be written or joined in order
+    '''
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(wbits=31)
+    for position, chunk in enumerate(chunks):
+        piece = compressor.compress(chunk.to_csv(index=False, header=position == 0).encode('utf-8'))
+        if piece:
+            yield piece
+    yield compressor.flush()
+
+
+@timed
+def date_histogram(days, granularity='M'):
+    '''
+    Returns the number of articles published per day, week or month.
+
+    Dates are binned here, so a chart only needs one bar per period whatever the number of articles.
+
+            Parameters:
+                    days (array): days of publication as int64 days since 1970-01-01
+                    granularity (str): 'D' (day), 'W' (week, starting on Monday) or 'M' (month)
+
+            Returns:
+                    histogram (DataFrame): columns Date (first day of the period) and Articles
+    '''
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == 'D':
+        periods = days.astype('datetime64[D]')
+    elif granularity == 'W':
+        # 1970-01-01 was a Thursday
+        periods = (days - (days + 3) % 7).astype('datetime64[D]')
+    elif granularity == 'M':
+        periods = days.astype('datetime64[D]').astype('datetime64[M]')
+    else:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    periods, counts = np.unique(periods, return_counts=True)
+    return pd.DataFrame({'Date': periods.astype('datetime64[ns]'), 'Articles': counts})
+
+
+def build_trend_cube(term_matrix, days):
+    '''
+    Returns the number of articles containing each term, per month of publication.
+
+            Parameters:
+                    term_matrix (csr_matrix): term matrix created with build_term_matrix
+                    days (array): day of publication of each row of term_matrix, as int64 days since 1970-01-01
+
+            Returns:
+                    cube (dict): counts (csr_matrix with one row per term of the vocabulary and one 
+                                 column per month) and months (datetime64[M] of each column)
+    '''
+    months = np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    first_month = months.min() if len(months) else 0
+    n_months = int(months.max() - first_month + 1) if len(months) else 0
+    # Articles x terms presence (0 or 1), aggregated by a months x articles indicator matrix
+    presence = sparse.csr_matrix((np.ones_like(term_matrix.data), term_matrix.indices, term_matrix.indptr),
+                                 shape=term_matrix.shape)
+    by_month = sparse.csr_matrix((np.ones(len(months), dtype=np.int32), (months - first_month, np.arange(len(months)))),
+                                 shape=(n_months, len(months)))
+    counts = (by_month @ presence).T.tocsr()
+    return {'counts': counts,
+            'months': np.arange(first_month, first_month + n_months).astype('datetime64[M]')}
+
+
+@timed
+def keyword_trends(cube, vocabulary, keywords_list):
+    '''
+    Returns the monthly number of articles containing each keyword, read from the trend cube.
+
+            Parameters:
+                    cube (dict): trend cube created with build_trend_cube
+                    vocabulary (list): vocabulary of the cube
+                    keywords_list (list): single-word keywords; words absent from the articles have no articles
+
+            Returns:
+                    trends (DataFrame): one row per month (Date column) and one column per keyword
+    '''
+    keywords_list = [keyword.strip().lower() for keyword in keywords_list]
+    term_ids = []
+    for keyword in keywords_list:
+        if TOKEN_PATTERN.findall(keyword) != [keyword]:
+            raise ValueError(f'"{keyword}" is not a single word.')
+        term_id = bisect_left(vocabulary, keyword)
+        term_ids.append(term_id if term_id < len(vocabulary) and vocabulary[term_id] == keyword else None)
+    found = [term_id for term_id in term_ids if term_id is not None]
+    series = cube['counts'][found].toarray()
+    values = np.zeros((len(keywords_list), len(cube['months'])), dtype=np.int64)
+    values[[i for i, term_id in enumerate(term_ids) if term_id is not None]] = series
+    trends = pd.DataFrame(values.T, columns=keywords_list)
+    trends.insert(0, 'Date', cube['months'].astype('datetime64[ns]'))
+    return trends
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Access to the articles from the Streamlit pages. The Corpus is loaded once per process 
+# and shared by every session and thread; a session only keeps its keywords and the 
+# row ids of the matching articles.
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from app_functions import (build_corpus, csv_gzip_chunks, file_checksum, manifest_path, normalize_keywords, query_rows,
+                           refresh_corpus, search_rows, snapshot_checksum, snapshot_path)
+from caches import LRUCache
+from sqlite_backend import DATABASE_FORMAT, articles_by_id, connect, database_metadata, database_path, search_ids
+from timing import run_records, timed
+
+
+DATA_PATH = Path(__file__).parent / 'Vegan_Articles.csv'
+# Rendered wordclouds (PNG) and maps (figure JSON) kept in memory
+ARTIFACT_CACHE_SIZE = 64 * 2**20
+# Row ids of the articles matching the most recent keyword sets
+QUERY_CACHE_SIZE = 32 * 2**20
+# Articles converted to CSV at a time when exporting
+EXPORT_CHUNK_SIZE = 5000
+# Exported CSV files, shared by all sessions and processes, and their lifetime in seconds
+EXPORT_DIRECTORY = Path(tempfile.gettempdir()) / 'vegan-exports'
+EXPORT_MAX_AGE = 3600
+# 'sqlite' to search keywords and read articles from the database written by python ingest.py --sqlite
+BACKEND = os.environ.get('VEGAN_BACKEND', 'memory')
+
+# SQLite connections can not be shared between threads, so each session thread opens its own
+_connections = threading.local()
+
+
+def file_mtime(path):
+    '''
+    Returns the modification time of a file, None if it does not exist.
+
+            Parameters:
+                    path (Path): path of the file
+
+            Returns:
+                    mtime (int): nanoseconds
+    '''
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@st.cache_resource
+def get_corpus_state():
+    '''
+    Returns the current Corpus of the process with the state of the files it was loaded from.
+
+            Returns:
+                    state (dict): corpus, csv_mtime, csv_sha256 (checksum of the CSV), manifest_mtime 
+                                  and the lock guarding updates
+    '''
+    csv_mtime, mtime = file_mtime(DATA_PATH), file_mtime(manifest_path(DATA_PATH))
+    corpus = build_corpus(DATA_PATH)
+    return {'corpus': corpus, 'csv_mtime': csv_mtime, 'csv_sha256': snapshot_checksum(snapshot_path(DATA_PATH)),
+            'manifest_mtime': mtime, 'lock': threading.Lock()}
+
+
+def get_corpus():
+    '''
+    Returns the Corpus shared by all sessions, loading it at the first call of the process.
+
+    Articles appended with append_articles (python ingest.py --append) are added when the 
+    manifest changes. If the CSV itself changed, the corpus is rebuilt. The new corpus replaces 
+    the old one in a single assignment, so a run sees either version as a whole; sessions 
+    search again since their key includes the version. Texts and the index are memory-mapped,
+    so with the SQLite backend they are only read for boolean queries and while the database 
+    is out of date.
+
+            Returns:
+                    corpus (Corpus)
+    '''
+    state = get_corpus_state()
+    csv_mtime, mtime = file_mtime(DATA_PATH), file_mtime(manifest_path(DATA_PATH))
+    if (csv_mtime, mtime) != (state['csv_mtime'], state['manifest_mtime']):
+        with state['lock']:
+            if csv_mtime != state['csv_mtime']:
+                # Only a different content replaces the dataset, not a new modification time
+                checksum = file_checksum(DATA_PATH)
+                if checksum != state['csv_sha256']:
+                    state['corpus'] = build_corpus(DATA_PATH)
+                    state['csv_sha256'] = checksum
+                    state['manifest_mtime'] = mtime
+                state['csv_mtime'] = csv_mtime
+            if mtime != state['manifest_mtime']:
+                state['corpus'] = refresh_corpus(state['corpus'], DATA_PATH)
+                state['manifest_mtime'] = mtime
+    return state['corpus']
+
+
+@st.cache_resource
+def get_query_cache():
+    '''
+    Returns the cache of keyword search results shared by all sessions.
+
+            Returns:
+                    cache (LRUCache): row ids by session_query_key(corpus)
+    '''
+    return LRUCache(QUERY_CACHE_SIZE)
+
+
+def get_database(corpus):
+    '''
+    Returns the connection of the current thread to the SQLite database, None with the memory backend.
+
+    All connections of all processes read the same file, cached once by the OS. A thread 
+    reconnects when the database is written again (python ingest.py --sqlite). A database 
+    written from another CSV or another number of appended batches than the corpus would 
+    return other row ids, and one written with another schema (DATABASE_FORMAT) other 
+    matches, so None is returned as well and the memory backend is used until the database 
+    is written again, as when it was never written.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+
+            Returns:
+                    connection (Connection)
+    '''
+    if BACKEND != 'sqlite':
+        return None
+    path = database_path(DATA_PATH)
+    mtime = file_mtime(path)
+    if mtime is None:
+        # Not written yet
+        return None
+    if getattr(_connections, 'mtime', None) != mtime:
+        if getattr(_connections, 'connection', None) is not None:
+            _connections.connection.close()
+        _connections.connection = connect(path)
+        _connections.metadata = database_metadata(_connections.connection)
+        _connections.mtime = mtime
+    metadata = _connections.metadata
+    if ((metadata['csv_sha256'], metadata['version'], metadata['format'])
+            != (get_corpus_state()['csv_sha256'], corpus.version, DATABASE_FORMAT)):
+        return None
+    return _connections.connection
+
+
+def article_rows(corpus, rows):
+    '''
+    Returns the articles of some rows, with their original case, from the database with the 
+    SQLite backend and from the corpus otherwise.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+                    rows (array): row ids
+
+            Returns:
+                    df (DataFrame): Title, Date, Link and Text columns, in the order of rows
+    '''
+    database = get_database(corpus)
+    if database is None:
+        return corpus.df.iloc[rows]
+    return articles_by_id(rows, database)
+
+
+def iter_article_rows(corpus, rows, chunksize=EXPORT_CHUNK_SIZE):
+    '''
+    Yields the articles of some rows in chunks, read with article_rows.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+                    rows (array): row ids
+                    chunksize (int): number of articles per dataframe
+
+            Returns:
+                    chunks (generator): dataframes with Title, Date, Link and Text columns
+    '''
+    for start in range(0, len(rows), chunksize):
+        yield article_rows(corpus, rows[start:start + chunksize])
+
+
+def export_file(corpus, rows):
+    '''
+    Returns the path of the gzip-compressed CSV file of the articles matching the session's 
+    keywords, written at the first call for these keywords.
+
+    Files are named after the CSV checksum and the session's query key, so each export is 
+    only compressed once for all sessions and a session only keeps its key. Files older 
+    than EXPORT_MAX_AGE are removed when a new one is written.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+                    rows (array): row ids of the matching articles, see session_rows
+
+            Returns:
+                    path (Path)
+    '''
+    key = (get_corpus_state()['csv_sha256'],) + session_query_key(corpus)
+    path = EXPORT_DIRECTORY / (hashlib.sha256(repr(key).encode()).hexdigest() + '.csv.gz')
+    if path.exists():
+        return path
+    EXPORT_DIRECTORY.mkdir(exist_ok=True)
+    now = time.time()
+    for old_path in EXPORT_DIRECTORY.glob('*.csv.gz'):
+        try:
+            if now - old_path.stat().st_mtime > EXPORT_MAX_AGE:
+                old_path.unlink()
+        except FileNotFoundError:
+            # Removed by another session
+            pass
+    # Written under a name of its own, so other sessions never serve a partial file
+    temporary_path = path.with_suffix(f'.{os.getpid()}-{threading.get_ident()}.tmp')
+    with open(temporary_path, 'wb') as file:
+        for piece in csv_gzip_chunks(iter_article_rows(corpus, rows)):
+            file.write(piece)
+    temporary_path.replace(path)
+    return path
+
+
+def session_query_key(corpus):
+    '''
+    Returns a key identifying the articles searched by the session: the search mode and the 
+    corpus version with the normalized keywords, or with the boolean query.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+
+            Returns:
+                    key (tuple)
+    '''
+    if st.session_state.get('boolean_query'):
+        return ('query', corpus.version, st.session_state['fill_kws'].strip())
+    return ('keywords', corpus.version) + normalize_keywords(st.session_state['fill_kws'])
+
+
+@timed
+def session_rows(corpus):
+    '''
+    Returns the row ids of the articles containing the session's keywords, or matching its 
+    boolean query in advanced search.
+
+    Results are shared by all pages and sessions through the query cache, so a keyword set 
+    is only searched once per process while it stays in the cache, and the session does 
+    not look it up again until its keywords change. An invalid query is reported in the 
+    sidebar and matches no article, as is a database out of date with the SQLite backend.
+
+            Parameters:
+                    corpus (Corpus): shared corpus
+
+            Returns:
+                    rows (array): sorted row ids, read-only
+    '''
+    if BACKEND == 'sqlite' and get_database(corpus) is None:
+        st.sidebar.warning('The article database is out of date, run python ingest.py --sqlite. '
+                           'Articles are searched in memory until then.')
+    key = session_query_key(corpus)
+    if st.session_state.get('rows_keywords') != key:
+        cache = get_query_cache()
+        rows = cache.get(key)
+        if rows is None:
+            try:
+                if key[0] == 'query':
+                    rows = query_rows(st.session_state['fill_kws'], corpus.index)
+                elif get_database(corpus) is not None:
+                    rows = search_ids(st.session_state['fill_kws'], get_database(corpus))
+                else:
+                    rows = search_rows(st.session_state['fill_kws'], corpus.df_lower, corpus.index)
+            except ValueError as error:
+                st.sidebar.error(f'Invalid query: {error}')
+                return np.array([], dtype=np.int32)
+            rows.setflags(write=False)
+            cache.put(key, rows, rows.nbytes)
+        st.session_state['rows'] = rows
+        st.session_state['rows_keywords'] = key
+    return st.session_state['rows']
+
+
+def session_memory_kb():
+    '''
+    Returns the memory held by the current session's state, in kilobytes.
+
+            Returns:
+                    size (float)
+    '''
+    size = 0
+    for key, value in st.session_state.items():
+        size += sys.getsizeof(key)
+        size += value.nbytes if isinstance(value, np.ndarray) else sys.getsizeof(value)
+    return size / 1024
+
+
+@st.cache_resource
+def get_artifact_cache():
+    '''
+    Returns the cache of rendered artifacts shared by all sessions.
+
+            Returns:
+                    cache (LRUCache)
+    '''
+    return LRUCache(ARTIFACT_CACHE_SIZE)
+
+
+def cached_artifact(key, render):
+    '''
+    Returns a rendered artifact from the shared cache, rendering and storing it if needed.
+
+            Parameters:
+                    key (tuple): (artifact type, session_query_key(corpus), column, stopwords, projection)
+                    render (function): function without arguments returning the artifact as bytes or str
+
+            Returns:
+                    artifact (bytes or str)
+    '''
+    cache = get_artifact_cache()
+    artifact = cache.get(key)
+    if artifact is None:
+        artifact = render()
+        cache.put(key, artifact, len(artifact))
+    return artifact
+
+
+def timing_panel():
+    '''
+    Shows in the sidebar, behind a debug toggle, how long each stage of the current run took.
+
+    Call it at the end of a page, once all its stages are recorded. Nested stages (functions 
+    called by a section) are indented. The counters of the shared caches are shown below.
+    '''
+    with st.sidebar:
+        if st.checkbox('Show timings', key='debug_timings', help='Milliseconds and rows of each stage of this run.'):
+            records = pd.DataFrame(run_records(), columns=['stage', 'ms', 'rows', 'depth'])
+            total = records.loc[records['depth'] == 0, 'ms'].sum()
+            records['stage'] = ['\u2003' * depth + name for depth, name in zip(records['depth'], records['stage'])]
+            records['ms'] = records['ms'].round(1)
+            st.dataframe(records[['stage', 'ms', 'rows']], hide_index=True)
+            st.caption(f'Total of the page sections: {total:.0f} ms')
+            caches = pd.DataFrame([get_query_cache().stats(), get_artifact_cache().stats()], index=['queries', 'artifacts'])
+            caches['hit_rate'] = (100 * caches['hit_rate']).round(1)
+            caches[['size', 'max_size']] = (caches[['size', 'max_size']] / 2**20).round(1)
+            st.dataframe(caches.rename(columns={'hit_rate': 'hit rate (%)', 'size': 'MB', 'max_size': 'max MB'}))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benchmarks of the app functions on synthetic corpora of growing size (see synthetic_corpus.py).
+# Every function runs in its own process, on data loaded beforehand, and is measured for wall
+# time, peak RSS and peak memory allocated by Python and NumPy (tracemalloc). Results are
+# compared with a JSON baseline, and the command fails if a function got slower or uses more
+# memory than the tolerance allows.
+# Usage: python benchmark.py [--sizes 10000 100000 1000000 10000000] [--save-baseline]
+# Synthetic CSV files are kept in --data-dir; 10M articles take about 35 GB of disk.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app_functions import (build_corpus, build_country_matrix, build_index, create_df_countries, create_df_keywords,
+                           create_text, dates_article, encode_columns, load_data, map_figure, map_template,
+                           positions_path, search_rows, tokens_path, vocabulary_path, write_snapshot)
+from synthetic_corpus import write_synthetic_corpus
+
+
+SIZES = [10000, 100000, 1000000, 10000000]
+BENCHMARKS = ['load_data', 'build_corpus', 'build_country_matrix', 'create_df_keywords', 'create_df_countries',
+              'create_text', 'dates_article', 'map_figure']
+BENCHMARK_KEYWORDS = 'plant-based, oat milk, tofu'
+BASELINE_PATH = Path(__file__).parent / 'benchmark_baseline.json'
+DATA_DIR = Path(__file__).parent / 'benchmark_data'
+
+
+def current_rss():
+    '''
+    Returns the resident memory of the current process in bytes, None if unknown.
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    '''
+    Resets the peak resident memory of the current process, where Linux allows it.
+
+            Returns:
+                    reset (bool): False if the peak still includes the memory used before
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    '''
+    Returns the peak resident memory of the current process in bytes.
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def setup_case(name, file_path):
+    '''
+    Loads the data a benchmarked function needs and returns the call to measure.
+
+            Parameters:
+                    name (str): name of the benchmarked function
+                    file_path (str): path to the synthetic raw data, with its snapshot already written
+
+            Returns:
+                    call (function): function without arguments
+    '''
+    if name == 'load_data':
+        return lambda: load_data(file_path)
+    if name == 'build_corpus':
+        # The files of write_tokens are removed before each run, so every run tokenizes the articles
+        # and builds the term and country matrices, the postings, the positions and the trends
+        def call():
+            for path in (tokens_path(file_path), vocabulary_path(file_path), positions_path(file_path)):
+                path.unlink(missing_ok=True)
+            return build_corpus(file_path)
+        return call
+    df, df_lower = load_data(file_path)
+    if name == 'dates_article':
+        return lambda: dates_article(df)
+    index = build_index(df_lower, 'Text')
+    if name == 'create_df_keywords':
+        return lambda: create_df_keywords(BENCHMARK_KEYWORDS, df_lower, index)
+    rows = search_rows(BENCHMARK_KEYWORDS, df_lower, index)
+    input_df = df_lower.iloc[rows]
+    if name == 'create_text':
+        return lambda: create_text(input_df, 'Text')
+    vocabulary, encoded = encode_columns(df_lower, ['Text'])
+    if name == 'build_country_matrix':
+        return lambda: build_country_matrix(encoded['Text'], vocabulary)
+    matrix = build_country_matrix(encoded['Text'], vocabulary)
+    if name == 'create_df_countries':
+        return lambda: create_df_countries(None, 'Text', matrix, rows=rows)
+    if name == 'map_figure':
+        # The template is built once per process, each rerun only patches it
+        df_countries = create_df_countries(None, 'Text', matrix, rows=rows)
+        map_template()
+        return lambda: map_figure(df_countries, 'orthographic')
+    raise ValueError(f'Unknown benchmark: {name}')
+
+
+def measure_case(name, file_path, repeat):
+    '''
+    Returns the metrics of a benchmarked function (run in a new process).
+
+    Wall time is the best of repeat runs. Peak RSS is the highest resident memory of the process
+    during these runs, including the data loaded beforehand. Allocations are measured in a
+    separate run, as tracemalloc slows every allocation down. Figures returned as dictionaries
+    are also measured for their size in JSON, as sent to the browser.
+    '''
+    call = setup_case(name, file_path)
+    rss_before = current_rss()
+    peak_reset = reset_peak_rss()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    peak = peak_rss()
+    tracemalloc.start()
+    result = call()
+    _, allocated_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics = {'seconds': min(seconds),
+               'peak_rss_mb': peak / 2**20,
+               'rss_before_mb': rss_before / 2**20 if rss_before is not None else None,
+               'peak_rss_exact': peak_reset,
+               'allocated_peak_mb': allocated_peak / 2**20}
+    if isinstance(result, dict) and 'data' in result:
+        metrics['serialized_kb'] = len(json.dumps(result)) / 1024
+    return metrics
+
+
+def run_benchmarks(sizes, data_dir=DATA_DIR, seed=0, repeat=3, names=BENCHMARKS):
+    '''
+    Runs the benchmarks on synthetic corpora, generating the corpora that do not exist yet.
+
+            Parameters:
+                    sizes (list): numbers of articles
+                    data_dir (Path): folder of the synthetic CSV files and snapshots
+                    seed (int): seed of the synthetic corpora
+                    repeat (int): number of timed runs per function
+                    names (list): names of the functions to benchmark
+
+            Returns:
+                    results (dict): metrics by size (as str) and function name
+    '''
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for size in sizes:
+        file_path = data_dir / f'synthetic-{size}-seed{seed}.csv'
+        if not file_path.exists():
+            print(f'Generating {size} articles in {file_path}')
+            write_synthetic_corpus(file_path, size, seed)
+        # Each step runs in a new process, so no measure includes the memory of another one
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            pool.submit(write_snapshot, file_path).result()
+        results[str(size)] = {}
+        for name in names:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                metrics = pool.submit(measure_case, name, file_path, repeat).result()
+            results[str(size)][name] = metrics
+            print(f"{size:>10} {name:<20} {metrics['seconds']:10.4f} s {metrics['peak_rss_mb']:10.1f} MB peak RSS "
+                  f"{metrics['allocated_peak_mb']:10.1f} MB allocated"
+                  + (f" {metrics['serialized_kb']:10.1f} kB in JSON" if 'serialized_kb' in metrics else ''))
+    return results
+
+
+def find_regressions(results, baseline, time_tolerance=0.2, memory_tolerance=0.1, min_seconds=0.005):
+    '''
+    Returns the metrics worse than their baseline by more than the tolerance.
+
+            Parameters:
+                    results (dict): metrics by size and function, as returned by run_benchmarks
+                    baseline (dict): metrics of a previous run, in the same format
+                    time_tolerance (float): allowed relative increase of the wall time
+                    memory_tolerance (float): allowed relative increase of peak RSS and allocations
+                    min_seconds (float): time increases smaller than this are timer noise
+
+            Returns:
+                    regressions (list): descriptions of the regressions
+    '''
+    tolerances = {'seconds': time_tolerance, 'peak_rss_mb': memory_tolerance, 'allocated_peak_mb': memory_tolerance,
+                  'serialized_kb': memory_tolerance}
+    regressions = []
+    for size, functions in results.items():
+        for name, metrics in functions.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            for metric, tolerance in tolerances.items():
+                if metric not in metrics or metric not in reference:
+                    continue
+                if metric == 'seconds' and metrics[metric] - reference[metric] < min_seconds:
+                    continue
+                if metrics[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(f'{name} on {size} articles: {metric} {metrics[metric]:.4g} '
+                                       f'instead of {reference[metric]:.4g} (+{metrics[metric] / reference[metric] - 1:.0%})')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the app functions on synthetic corpora.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES[:2],
+                        help=f'numbers of articles, e.g. {" ".join(map(str, SIZES))}')
+    parser.add_argument('--functions', nargs='+', default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per function, the best is kept')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--output', type=Path, help='also write the results to this JSON file')
+    parser.add_argument('--time-tolerance', type=float, default=0.2)
+    parser.add_argument('--memory-tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    results = run_benchmarks(args.sizes, args.data_dir, args.seed, args.repeat, args.functions)
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'seed': args.seed,
+              'results': results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=1))
+    if args.save_baseline:
+        # Sizes and functions not run this time keep their previous baseline
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {'results': {}}
+        for size, functions in results.items():
+            baseline['results'].setdefault(size, {}).update(functions)
+        baseline.update({key: value for key, value in report.items() if key != 'results'})
+        args.baseline.write_text(json.dumps(baseline, indent=1))
+        print(f'Baseline saved to {args.baseline}')
+    elif args.baseline.exists():
+        regressions = find_regressions(results, json.loads(args.baseline.read_text())['results'],
+                                       args.time_tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regression against the baseline.')
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Size-bounded caches shared by all the sessions of the app.
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    Thread-safe cache that evicts the least recently used entries when its total size goes over a limit.
+
+    Sizes are given by the caller when adding an entry (bytes of a PNG, length of a JSON string...).
+
+            Parameters:
+                    max_size (int): maximal total size of the entries
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for key and marks it as recently used, or default if there is none.
+        '''
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size):
+        '''
+        Stores value for key, then evicts the least recently used entries until the cache fits in max_size.
+
+        Values larger than max_size are not stored.
+        '''
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def stats(self):
+        '''
+        Returns a dictionary with the number of hits, misses, hit rate, entries and total size of the cache.
+        '''
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / requests if requests else 0.0,
+                    'entries': len(self._entries),
+                    'size': self.size,
+                    'max_size': self.max_size}
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Regression checks of the index and of the incremental updates against brute force, on
+# seeded synthetic articles (see synthetic_corpus.py) with punctuation added between words:
+# - keyword searches (search_rows) find the texts containing a keyword as a substring,
+# - boolean queries (query_rows) the texts whose terms match the query, read one by one,
+# - a corpus refreshed after appends (refresh_corpus), merged in memory or read from the
+#   files of write_tokens, equals the corpus built from all the articles at once,
+# - the SQLite database, appended to after each batch, finds the rows of search_rows (when
+#   SQLite has the trigram tokenizer).
+# Usage: python check_index.py [--articles 3000] [--seed 0]
+# Every mismatch is printed, and the command fails if there is any.
+
+import argparse
+import dataclasses
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app_functions import (TOKEN_PATTERN, Corpus, append_articles, build_corpus, parse_query, query_rows,
+                           refresh_corpus, search_rows, write_tokens)
+from sqlite_backend import connect, search_ids, write_database
+from synthetic_corpus import generate_articles
+
+
+# Texts put between some words of the synthetic articles: usual separators, others that are
+# read from the texts, and words that lower() changes in length
+PUNCTUATION = [', ', '. ', '-', ' - ', ' (', ') ', '"', ': ', '/', '\n', "'s ", '’ ', ' & ', '!! ', '—', '...',
+               ' 2021 ', ' İstanbul ', ' STRASSE ', ' straße ']
+KEYWORDS = ['', 'a', 'in', 'vegan', 'plant-based', 'plant based', 'oat milk', 'in the', 'e the', 'milk, tofu',
+            'vegan.', ' vegan', 'vegan ', 's ', ', ', '-', ' - ', '...', '"', "'s", '2021', 'i̇stanbul',
+            'istanbul', 'strasse', 'straße', 'ß', 'xyzzy', 'the uk', 'united states']
+QUERIES = ['vegan', 'oat milk', '"plant based"', 'plant-based', 'vegan AND NOT milk', 'tofu OR (oat AND milk)',
+           'veg*', 'a*', '"in the"', 'NOT the', '"i̇stanbul"', 'straße OR strasse', 'xyzzy OR vegan',
+           '(milk OR cheese) NOT (oat OR almond)']
+
+
+def punctuated_articles(n_articles, seed=0, share=0.05):
+    '''
+    Returns synthetic articles where some spaces between words are replaced with punctuation.
+
+            Parameters:
+                    n_articles (int): number of articles
+                    seed (int): random seed
+                    share (float): share of the spaces replaced
+
+            Returns:
+                    df (DataFrame): Title, Date, Link and Text columns
+    '''
+    rng = np.random.default_rng(seed)
+    df = pd.concat(generate_articles(n_articles, seed), ignore_index=True)
+    texts = []
+    for text in df['Text']:
+        words = text.split(' ')
+        separators = np.full(len(words) - 1, ' ', dtype=object)
+        replaced = rng.random(len(separators)) < share
+        separators[replaced] = rng.choice(PUNCTUATION, replaced.sum())
+        texts.append(''.join(word + separator for word, separator in zip(words, separators)) + words[-1])
+    df['Text'] = texts
+    return df
+
+
+def sample_keywords(texts, n_keywords, seed=0):
+    '''
+    Returns KEYWORDS with word sequences and substrings drawn from texts.
+
+            Parameters:
+                    texts (Series): lower-case texts
+                    n_keywords (int): number of keywords drawn
+                    seed (int): random seed
+
+            Returns:
+                    keywords (list)
+    '''
+    rng = np.random.default_rng(seed)
+    keywords = list(KEYWORDS)
+    for text in texts.sample(n_keywords // 2, random_state=seed):
+        words = text.split(' ')
+        start = rng.integers(max(1, len(words) - 4))
+        keywords.append(' '.join(words[start:start + rng.integers(2, 5)]))
+        start = rng.integers(max(1, len(text) - 25))
+        keywords.append(text[start:start + rng.integers(1, 25)])
+    return keywords
+
+
+def check_keywords(corpus, keywords):
+    '''
+    Returns the keywords for which search_rows does not find the texts containing them.
+
+            Parameters:
+                    corpus (Corpus): corpus searched
+                    keywords (list): keywords, searched one by one (those with commas are split)
+
+            Returns:
+                    mismatches (list): descriptions of the mismatches
+    '''
+    texts = corpus.df_lower['Text'].astype(object)
+    mismatches = []
+    for keyword in keywords:
+        contained = [texts.str.contains(part.strip(), regex=False).to_numpy(dtype=bool)
+                     for part in keyword.lower().split(',')]
+        expected = np.flatnonzero(np.logical_or.reduce(contained))
+        rows = search_rows(keyword, corpus.df_lower, corpus.index)
+        if not np.array_equal(rows, expected):
+            mismatches.append(f'search_rows({keyword!r}): {len(rows)} rows instead of {len(expected)}')
+    return mismatches
+
+
+def tree_matches(tree, terms):
+    '''
+    Returns whether the terms of a text match the syntax tree of a boolean query.
+
+            Parameters:
+                    tree (tuple): syntax tree created with parse_query
+                    terms (list): terms of the text, in order
+
+            Returns:
+                    match (bool)
+    '''
+    operator, operand = tree
+    if operator == 'phrase':
+        return any(terms[start:start + len(operand)] == operand for start in range(len(terms) - len(operand) + 1))
+    if operator == 'prefix':
+        return any(term.startswith(operand) for term in terms)
+    if operator == 'not':
+        return not tree_matches(operand, terms)
+    matches = (tree_matches(branch, terms) for branch in operand)
+    return all(matches) if operator == 'and' else any(matches)
+
+
+def check_queries(corpus, queries):
+    '''
+    Returns the boolean queries for which query_rows does not find the texts matching them.
+
+            Parameters:
+                    corpus (Corpus): corpus searched
+                    queries (list): boolean queries, see parse_query
+
+            Returns:
+                    mismatches (list): descriptions of the mismatches
+    '''
+    terms = [TOKEN_PATTERN.findall(text) for text in corpus.df_lower['Text'].astype(object)]
+    mismatches = []
+    for query in queries:
+        tree = parse_query(query)
+        expected = np.array([row for row, text_terms in enumerate(terms) if tree_matches(tree, text_terms)])
+        rows = query_rows(query, corpus.index)
+        if not np.array_equal(rows, expected):
+            mismatches.append(f'query_rows({query!r}): {len(rows)} rows instead of {len(expected)}')
+    return mismatches
+
+
+def equal_values(value, expected):
+    '''
+    Returns whether two attributes of corpora, or two items of them, are equal.
+    '''
+    if sparse.issparse(value):
+        return value.shape == expected.shape and (value != expected).nnz == 0
+    if isinstance(value, dict):
+        return value.keys() == expected.keys() and all(equal_values(value[key], expected[key]) for key in value)
+    if isinstance(value, pd.DataFrame):
+        return value.equals(expected)
+    if isinstance(value, np.ndarray):
+        return np.array_equal(value, expected)
+    return value == expected
+
+
+def compare_corpora(corpus, expected, name):
+    '''
+    Returns the attributes of a corpus that differ from the corpus built from the same articles at once.
+
+            Parameters:
+                    corpus (Corpus): corpus built incrementally
+                    expected (Corpus): corpus built from all the articles
+                    name (str): how corpus was built, for the descriptions
+
+            Returns:
+                    mismatches (list): descriptions of the mismatches
+    '''
+    mismatches = []
+    for field in dataclasses.fields(Corpus):
+        if field.name == 'version':
+            continue
+        value, expected_value = getattr(corpus, field.name), getattr(expected, field.name)
+        if isinstance(value, dict):
+            names = [f'{field.name}[{key!r}]' for key in expected_value
+                     if key not in value or not equal_values(value[key], expected_value[key])]
+        else:
+            names = [] if equal_values(value, expected_value) else [field.name]
+        mismatches += [f'{name}: {attribute} differs from a full build' for attribute in names]
+    return mismatches
+
+
+def check_sqlite(corpus, file_path, keywords, name):
+    '''
+    Returns the keywords for which the SQLite database of a raw data file does not find the rows of search_rows.
+
+            Parameters:
+                    corpus (Corpus): corpus of the same articles
+                    file_path (Path): path to raw data, its database is written or appended to
+                    keywords (list): keywords, searched one by one
+                    name (str): how the database was written, for the descriptions
+
+            Returns:
+                    mismatches (list): descriptions of the mismatches
+    '''
+    connection = connect(write_database(file_path))
+    mismatches = []
+    try:
+        for keyword in keywords:
+            ids = search_ids(keyword, connection)
+            rows = search_rows(keyword, corpus.df_lower, corpus.index)
+            if not np.array_equal(ids, rows):
+                mismatches.append(f'{name}: search_ids({keyword!r}) {len(ids)} rows instead of {len(rows)}')
+    finally:
+        connection.close()
+    return mismatches
+
+
+def run_checks(directory, n_articles, seed=0):
+    '''
+    Runs all the checks on synthetic articles written to a folder.
+
+            Parameters:
+                    directory (Path): folder of the CSV files and of the files derived from them
+                    n_articles (int): number of articles
+                    seed (int): random seed
+
+            Returns:
+                    mismatches (list): descriptions of the mismatches
+    '''
+    df = punctuated_articles(n_articles, seed)
+    # Two thirds first, then two batches; the first one brings new terms
+    first, second = 2 * n_articles // 3, 5 * n_articles // 6
+    df.loc[first:second - 1, 'Text'] += ' zyzzyva, aardvark-like quinoa.'
+    paths = {name: directory / f'{name}.csv' for name in ('full', 'part', 'base', 'batch1', 'batch2')}
+    for name, articles in zip(paths, (df, df.iloc[:second], df.iloc[:first], df.iloc[first:second], df.iloc[second:])):
+        articles.to_csv(paths[name], index=False)
+
+    expected = build_corpus(paths['full'])
+    keywords = sample_keywords(expected.df_lower['Text'].astype(object), 40, seed) + ['zyzzyva', 'quinoa.', 'e-like']
+    mismatches = check_keywords(expected, keywords) + check_queries(expected, QUERIES + ['zyzzyva AND quinoa'])
+    with_sqlite = sqlite3.sqlite_version_info >= (3, 34, 0)
+    if not with_sqlite:
+        print(f'SQLite {sqlite3.sqlite_version} has no trigram tokenizer, the database is not checked')
+
+    base_path = paths['base']
+    corpus = build_corpus(base_path)
+    if with_sqlite:
+        write_database(base_path)
+    # New batches that were not tokenized yet are merged in memory
+    append_articles(base_path, paths['batch1'])
+    corpus = refresh_corpus(corpus, base_path)
+    mismatches += compare_corpora(corpus, build_corpus(paths['part']), 'refresh_corpus in memory')
+    if with_sqlite:
+        mismatches += check_sqlite(corpus, base_path, keywords, 'database after one append')
+    append_articles(base_path, paths['batch2'])
+    mismatches += compare_corpora(refresh_corpus(corpus, base_path), expected, 'refresh_corpus in memory')
+    # As python ingest.py --append does: the files of write_tokens are merged with the new batches, 
+    # and read by the next refresh
+    write_tokens(base_path)
+    mismatches += compare_corpora(refresh_corpus(corpus, base_path), expected, 'refresh_corpus from the files')
+    mismatches += compare_corpora(build_corpus(base_path), expected, 'build_corpus after appends')
+    if with_sqlite:
+        mismatches += check_sqlite(expected, base_path, keywords, 'database after two appends')
+        mismatches += check_sqlite(expected, paths['full'], keywords, 'full database')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the index and the incremental updates against brute force.')
+    parser.add_argument('--articles', type=int, default=3000, help='number of synthetic articles')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        mismatches = run_checks(Path(directory), args.articles, args.seed)
+    for mismatch in mismatches:
+        print(f'MISMATCH {mismatch}')
+    if mismatches:
+        sys.exit(1)
+    print('The index matches brute force and the incremental updates a full build.')
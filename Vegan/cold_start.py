@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Cold-start benchmark of the pages: time to run the imports of each page in a new Python
+# process, i.e. before Streamlit can render anything. With --compare, the pages of another
+# git revision are measured too, e.g. to check a change against the previous commit.
+# Usage: python cold_start.py [--compare HEAD~1] [--repeat 5]
+
+import argparse
+import ast
+import io
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+
+PAGES = ['📰_Keywords.py', 'pages/🌍_Countries.py', 'pages/📅_Dates.py']
+APP_DIR = Path(__file__).parent
+
+# Run in the new process: page imports between the two time measures
+TIMER = '''import sys, time
+_start = time.perf_counter()
+{imports}
+print(time.perf_counter() - _start, len(sys.modules))
+'''
+
+
+def page_imports(page_path):
+    '''
+    Returns the import statements at the top level of a page, as source code.
+
+            Parameters:
+                    page_path (Path): path of the page
+
+            Returns:
+                    source (str): one import statement per line
+    '''
+    tree = ast.parse(Path(page_path).read_text(encoding='utf-8'))
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_time(app_dir, page, repeat=5):
+    '''
+    Returns the time to import the modules of a page in a new Python process.
+
+    A first run compiles the bytecode and is not counted; the median of the next runs is kept.
+
+            Parameters:
+                    app_dir (Path): folder of the app (with app_functions.py)
+                    page (str): path of the page in app_dir
+                    repeat (int): number of measured runs
+
+            Returns:
+                    seconds (float): median import time
+                    modules (int): number of modules loaded
+    '''
+    code = TIMER.format(imports=page_imports(Path(app_dir) / page))
+    runs = []
+    for _ in range(repeat + 1):
+        output = subprocess.run([sys.executable, '-c', code], cwd=app_dir, capture_output=True, text=True, check=True)
+        seconds, modules = output.stdout.split()
+        runs.append((float(seconds), int(modules)))
+    return statistics.median(seconds for seconds, _ in runs[1:]), runs[-1][1]
+
+
+def checkout_revision(revision, directory):
+    '''
+    Writes the files of the app at a git revision to a folder.
+
+            Parameters:
+                    revision (str): git revision, e.g. HEAD~1
+                    directory (str): destination folder
+
+            Returns:
+                    app_dir (Path): folder of the app at that revision
+    '''
+    top_level = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=APP_DIR, capture_output=True, text=True,
+                               check=True).stdout.strip()
+    prefix = APP_DIR.resolve().relative_to(Path(top_level).resolve()).as_posix()
+    archive = subprocess.run(['git', 'archive', '--format=tar', f'{revision}:{prefix}'], cwd=top_level,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return Path(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of each page in a new process.')
+    parser.add_argument('--compare', metavar='REVISION', help='also measure the pages at this git revision')
+    parser.add_argument('--repeat', type=int, default=5, help='measured runs per page, the median is kept')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        trees = {'current': APP_DIR}
+        if args.compare:
+            trees = {args.compare: checkout_revision(args.compare, directory), **trees}
+        print(f"{'page':<24}" + ''.join(f'{name:>24}' for name in trees))
+        for page in PAGES:
+            cells = []
+            for app_dir in trees.values():
+                seconds, modules = import_time(app_dir, page, args.repeat)
+                cells.append(f'{seconds * 1000:8.0f} ms {modules:5d} modules')
+            print(f'{page:<24}' + ''.join(f'{cell:>24}' for cell in cells))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Writes the columnar snapshot of the Vegan articles ahead of time, so the app does not
+# have to parse the CSV at its first start, or appends a CSV of new articles to it. The
+# articles are then tokenized into term ids (write_tokens), only the new ones after --append.
+# Usage: python ingest.py [path/to/Vegan_Articles.csv] [--append path/to/new_articles.csv] [--sqlite]
+# Running apps pick up the appended articles at their next run, without a restart.
+# --sqlite then (re)writes the database of the SQLite backend (see sqlite_backend.py), which
+# running apps open at their next search. An existing database gets the appended articles
+# after --append, without --sqlite.
+
+import argparse
+from pathlib import Path
+
+from app_functions import append_articles, write_snapshot, write_tokens
+from sqlite_backend import database_path, write_database
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prepare the Vegan articles for the app.')
+    parser.add_argument('file_path', nargs='?', default=Path(__file__).parent / 'Vegan_Articles.csv',
+                        help='raw data CSV')
+    parser.add_argument('--append', metavar='CSV', action='append', default=[],
+                        help='CSV of new articles, with the same columns; can be repeated')
+    parser.add_argument('--sqlite', action='store_true', help='also write the database of the SQLite backend')
+    args = parser.parse_args()
+    if args.append:
+        for batch_path in args.append:
+            version = append_articles(args.file_path, batch_path)
+            print(f'{batch_path} appended, dataset version {version}')
+    else:
+        print(f'Snapshot written to {write_snapshot(args.file_path)}')
+    print(f'Tokens written to {write_tokens(args.file_path)}')
+    if args.sqlite or (args.append and database_path(args.file_path).exists()):
+        print(f'Database written to {write_database(args.file_path)}')
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Generates the country gazetteer of the app, resources/countries.json: the canonical name, ISO3 
+# code and aliases of every country searched in the articles. The app only reads the JSON file, 
+# country_converter is only needed here: pip install country_converter==1.0.0
+# Usage: python make_gazetteer.py [--output resources/countries.json]
+# Bump GAZETTEER_VERSION whenever the names or aliases change.
+
+import argparse
+import json
+from pathlib import Path
+
+
+GAZETTEER_VERSION = 1
+GAZETTEER_PATH = Path(__file__).parent / 'resources' / 'countries.json'
+# Canonical names, as displayed by the app
+COUNTRIES = ['Afghanistan', 'Aland Islands', 'Albania', 'Algeria', 'American Samoa', 'Andorra', 'Angola', 'Anguilla', 'Antarctica', 'Antigua and Barbuda', 'Argentina', 'Armenia', 'Aruba', 'Australia', 'Austria', 'Azerbaijan', 'Bahamas', 'Bahrain', 'Bangladesh', 'Barbados', 'Belarus', 'Belgium', 'Belize', 'Benin', 'Bermuda', 'Bhutan', 'Bolivia, Plurinational State of', 'Bonaire, Sint Eustatius and Saba', 'Bosnia and Herzegovina', 'Botswana', 'Bouvet Island', 'Brazil', 'British Indian Ocean Territory', 'Brunei Darussalam', 'Bulgaria', 'Burkina Faso', 'Burundi', 'Cambodia', 'Cameroon', 'Canada', 'Cape Verde', 'Cayman Islands', 'Central African Republic', 'Chad', 'Chile', 'China', 'Christmas Island', 'Cocos (Keeling) Islands', 'Colombia', 'Comoros', 'Congo', 'Congo, The Democratic Republic of the', 'Cook Islands', 'Costa Rica', "Côte d'Ivoire", 'Croatia', 'Cuba', 'Curaçao', 'Cyprus', 'Czech Republic', 'Denmark', 'Djibouti', 'Dominica', 'Dominican Republic', 'Ecuador', 'Egypt', 'El Salvador', 'Equatorial Guinea', 'Eritrea', 'Estonia', 'Ethiopia', 'Falkland Islands (Malvinas)', 'Faroe Islands', 'Fiji', 'Finland', 'France', 'French Guiana', 'French Polynesia', 'French Southern Territories', 'Gabon', 'Gambia', 'Georgia', 'Germany', 'Ghana', 'Gibraltar', 'Greece', 'Greenland', 'Grenada', 'Guadeloupe', 'Guam', 'Guatemala', 'Guernsey', 'Guinea', 'Guinea-Bissau', 'Guyana', 'Haiti', 'Heard Island and McDonald Islands', 'Holy See (Vatican City State)', 'Honduras', 'Hong Kong', 'Hungary', 'Iceland', 'India', 'Indonesia', 'Iran, Islamic Republic of', 'Iraq', 'Ireland', 'Isle of Man', 'Israel', 'Italy', 'Jamaica', 'Japan', 'Jersey', 'Jordan', 'Kazakhstan', 'Kenya', 'Kiribati', "Korea, Democratic People's Republic of", 'Korea, Republic of', 'Kuwait', 'Kyrgyzstan', "Lao People's Democratic Republic", 'Latvia', 'Lebanon', 'Lesotho', 'Liberia', 'Libya', 'Liechtenstein', 'Lithuania', 'Luxembourg', 'Macao', 'Macedonia, Republic of', 'Madagascar', 'Malawi', 'Malaysia', 'Maldives', 'Mali', 'Malta', 'Marshall Islands', 'Martinique', 'Mauritania', 'Mauritius', 'Mayotte', 'Mexico', 'Micronesia, Federated States of', 'Moldova, Republic of', 'Monaco', 'Mongolia', 'Montenegro', 'Montserrat', 'Morocco', 'Mozambique', 'Myanmar', 'Namibia', 'Nauru', 'Nepal', 'Netherlands', 'New Caledonia', 'New Zealand', 'Nicaragua', 'Niger', 'Nigeria', 'Niue', 'Norfolk Island', 'Northern Mariana Islands', 'Norway', 'Oman', 'Pakistan', 'Palau', 'Palestinian Territory, Occupied', 'Panama', 'Papua New Guinea', 'Paraguay', 'Peru', 'Philippines', 'Pitcairn', 'Poland', 'Portugal', 'Puerto Rico', 'Qatar', 'Réunion', 'Romania', 'Russian Federation', 'Rwanda', 'Saint Barthélemy', 'Saint Helena, Ascension and Tristan da Cunha', 'Saint Kitts and Nevis', 'Saint Lucia', 'Saint Martin (French part)', 'Saint Pierre and Miquelon', 'Saint Vincent and the Grenadines', 'Samoa', 'San Marino', 'Sao Tome and Principe', 'Saudi Arabia', 'Senegal', 'Serbia', 'Seychelles', 'Sierra Leone', 'Singapore', 'Sint Maarten (Dutch part)', 'Slovakia', 'Slovenia', 'Solomon Islands', 'Somalia', 'South Africa', 'South Georgia and the South Sandwich Islands', 'Spain', 'Sri Lanka', 'Sudan', 'Suriname', 'South Sudan', 'Svalbard and Jan Mayen', 'Swaziland', 'Sweden', 'Switzerland', 'Syrian Arab Republic', 'Taiwan, Province of China', 'Tajikistan', 'Tanzania, United Republic of', 'Thailand', 'Timor-Leste', 'Togo', 'Tokelau', 'Tonga', 'Trinidad and Tobago', 'Tunisia', 'Turkey', 'Turkmenistan', 'Turks and Caicos Islands', 'Tuvalu', 'Uganda', 'Ukraine', 'United Arab Emirates', 'United Kingdom', 'United States', 'United States Minor Outlying Islands', 'Uruguay', 'Uzbekistan', 'Vanuatu', 'Venezuela, Bolivarian Republic of', 'Viet Nam', 'Virgin Islands, British', 'Virgin Islands, U.S.', 'Wallis and Futuna', 'Yemen', 'Zambia', 'Zimbabwe']
+# Other spellings counted as mentions of a country, by ISO3 code
+ALIASES = {'GBR': ['UK'], 'USA': ['USA', 'United States of America']}
+
+
+def build_gazetteer():
+    '''
+    Returns the country gazetteer, with the ISO3 codes found by country_converter.
+
+            Returns:
+                    gazetteer (dict): version, source and countries (list of dictionaries with name, 
+                                      iso3 and aliases)
+    '''
+    import country_converter as coco
+    codes = coco.convert(names=COUNTRIES, to='ISO3', not_found=None)
+    missing = [name for name, code in zip(COUNTRIES, codes) if code is None]
+    if missing:
+        raise ValueError(f'No ISO3 code for: {", ".join(missing)}')
+    if len(set(codes)) != len(codes):
+        raise ValueError('Several countries have the same ISO3 code')
+    unknown = set(ALIASES) - set(codes)
+    if unknown:
+        raise ValueError(f'Aliases of unknown countries: {", ".join(sorted(unknown))}')
+    return {'version': GAZETTEER_VERSION,
+            'source': f'country_converter {coco.__version__}',
+            'countries': [{'name': name, 'iso3': code, 'aliases': ALIASES.get(code, [])}
+                          for name, code in zip(COUNTRIES, codes)]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate the country gazetteer of the app.')
+    parser.add_argument('--output', type=Path, default=GAZETTEER_PATH)
+    args = parser.parse_args()
+    gazetteer = build_gazetteer()
+    # One country per line, so that changes are easy to review
+    lines = ',\n'.join(json.dumps(country, ensure_ascii=False) for country in gazetteer['countries'])
+    header = json.dumps({key: value for key, value in gazetteer.items() if key != 'countries'}, ensure_ascii=False)
+    args.output.write_text(header[:-1] + ', "countries": [\n' + lines + '\n]}\n', encoding='utf-8')
+    print(f"{len(gazetteer['countries'])} countries written to {args.output}")
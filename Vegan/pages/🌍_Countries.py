@@ -4,20 +4,13 @@
 # In[1]:
 
 
-import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.express as px 
-from PIL import Image
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
-import matplotlib.pyplot as plt
 import streamlit as st
-import country_converter as coco
 from pathlib import Path
 
 # Custom library
-from app_functions import create_df_countries, create_map, countries, create_df_keywords
+from app_functions import create_df_countries, map_figure, countries
+from article_store import get_corpus, session_rows, session_memory_kb, timing_panel
+from timing import start_run, stage
 
 #--------------------------------- ---------------------------------  ---------------------------------
 #--------------------------------- SETTING UP THE APP
@@ -26,11 +19,14 @@ from app_functions import create_df_countries, create_map, countries, create_df_
 st.set_page_config(page_title="Countries | Vegan News", 
                    page_icon=":newspaper:", 
                    layout='wide')
+start_run('Countries')
 
 # Set up a sidebar that remains throughout the app, in all pages. 
 # Use session_state to save keywords entered by user.
 if 'fill_kws' not in st.session_state:
     st.session_state['fill_kws'] = 'alternative protein'
+if 'boolean_query' not in st.session_state:
+    st.session_state['boolean_query'] = False
 def change_value():
     st.session_state['fill_kws'] = keywords
     return
@@ -40,10 +36,18 @@ with st.sidebar:
     st.markdown("### **Choose keywords**")
     st.markdown('These keywords will apply throughout the site. Feel free to change them as you want.')
     keywords = st.text_input(label = 'Write your keywords, separated by commas: ', value=st.session_state.fill_kws, key='fill_kws')
+    st.checkbox('Advanced search', value=st.session_state.boolean_query, key='boolean_query',
+                help='Search whole words with AND, OR, NOT, parentheses, "exact phrases" and prefixes ending with * (e.g. "plant-based" AND (milk OR chees*) NOT oat).')
     enter = st.button("Let's do it!", key='submit_kws', on_click=change_value)
 
 # Load data
-input_df = create_df_keywords(st.session_state['fill_kws'], st.session_state['lower_df'])
+with stage('countries.load') as record:
+    corpus = get_corpus()
+    # Countries are counted from the row ids, the matching articles are not copied
+    rows = session_rows(corpus)
+    record['rows'] = len(rows)
+with st.sidebar:
+    st.caption(f'Memory used by this session: {session_memory_kb():.1f} kB')
 
 #---------------------------------------------------------------#
 # APP
@@ -54,8 +58,8 @@ col1, col2, col3 = st.columns((1,3,1))
 with col1:
     st.write('')
 with col2:
-    title_image = Image.open(Path(__file__).parents[2] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg')
-    st.image(title_image)
+    # Streamlit reads the file itself, PIL is not needed
+    st.image(str(Path(__file__).parents[2] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg'))
 with col3:
     st.write('')
 
@@ -71,11 +75,14 @@ with st.container():
         "Count countries mentioned in:",
         ("Articles' text", "Articles' title"), horizontal=True)
 
-        if where_to_look == "Articles' text":
-            df_countries = create_df_countries(input_df, 'Text')
-        else:
-            df_countries = create_df_countries(input_df, 'Title')
-        st.dataframe(df_countries[['Country', 'Number of times']].head(10), hide_index=True)
+        with stage('countries.table', rows=len(rows)):
+            if where_to_look == "Articles' text":
+                col = 'Text'
+                df_countries = create_df_countries(None, 'Text', corpus.countries_text, rows=rows)
+            else:
+                col = 'Title'
+                df_countries = create_df_countries(None, 'Title', corpus.countries_title, rows=rows)
+            st.dataframe(df_countries[['Country', 'Number of times']].head(10), hide_index=True)
     with col2_2:
         # See how many times a specific country was mentioned
         country_input = st.selectbox(label = 'What country do you want to check?', options = countries(with_abbreviations=False), help='Pick a country to see how many times it was mentioned.')
@@ -84,7 +91,7 @@ with st.container():
             st.write(f'{country_input} was cited {number} time(s)')
         except:
             st.write(f'Sorry, "{country_input}" is not a valid country name.')
-        st.info('United Kingdom results include mentions of "UK". United States results include mentions of "USA".')
+        st.info('United Kingdom results include mentions of "UK". United States results include mentions of "USA" and "United States of America".')
     
     # Display map
     with col2_3:
@@ -93,9 +100,14 @@ with st.container():
         ("Orthographic (globe)", "Equirectangular (plane)"), horizontal=True)
 
         if projection_type == "Orthographic (globe)":
-            figure = create_map(df_countries, 'orthographic')
+            projection = 'orthographic'
         else:
-            figure = create_map(df_countries, 'equirectangular')
-        st.plotly_chart(figure, use_container_width=True, sharing="streamlit")
+            projection = 'equirectangular'
+        # The map is built once per process, only the counts and the projection change
+        with stage('countries.map', rows=len(df_countries)):
+            figure = map_figure(df_countries, projection)
+            st.plotly_chart(figure, use_container_width=True, sharing="streamlit")
     
 
+# Timings of this run, behind the debug toggle
+timing_panel()
@@ -2,21 +2,14 @@
 # coding: utf-8
 
 
-import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import plotly.express as px 
-from PIL import Image
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
-import matplotlib.pyplot as plt
 import streamlit as st
-import country_converter as coco
-import datetime
 from pathlib import Path
 
 # Custom library
-from app_functions import create_df_keywords, dates_article
+from app_functions import date_stats, date_histogram, keyword_trends
+from article_store import get_corpus, session_rows, session_memory_kb, timing_panel
+from timing import start_run, stage
 
 #--------------------------------- ---------------------------------  ---------------------------------
 #--------------------------------- SETTING UP THE APP
@@ -25,11 +18,14 @@ from app_functions import create_df_keywords, dates_article
 st.set_page_config(page_title="Dates | Vegan News", 
                    page_icon=":newspaper:", 
                    layout='wide')
+start_run('Dates')
 
 # Set up a sidebar that remains throughout the app, in all pages. 
 # Use session_state to save keywords entered by user.
 if 'fill_kws' not in st.session_state:
     st.session_state['fill_kws'] = 'alternative protein'
+if 'boolean_query' not in st.session_state:
+    st.session_state['boolean_query'] = False
 
 def change_value():
     st.session_state['fill_kws'] = keywords
@@ -39,10 +35,17 @@ with st.sidebar:
     st.markdown("### **Choose keywords**")
     st.markdown('These keywords will apply throughout the site. Feel free to change them as you want.')
     keywords = st.text_input(label = 'Write your keywords, separated by commas: ', value=st.session_state.fill_kws, key='fill_kws')
+    st.checkbox('Advanced search', value=st.session_state.boolean_query, key='boolean_query',
+                help='Search whole words with AND, OR, NOT, parentheses, "exact phrases" and prefixes ending with * (e.g. "plant-based" AND (milk OR chees*) NOT oat).')
     enter = st.button("Let's do it!", key='submit_kws', on_click=change_value)
 
 # Load data
-input_df = create_df_keywords(st.session_state['fill_kws'], st.session_state['lower_df'])
+with stage('dates.load') as record:
+    corpus = get_corpus()
+    rows = session_rows(corpus)
+    record['rows'] = len(rows)
+with st.sidebar:
+    st.caption(f'Memory used by this session: {session_memory_kb():.1f} kB')
 
 #---------------------------------------------------------------#
 # APP
@@ -53,8 +56,8 @@ col1, col2, col3 = st.columns((1,3,1))
 with col1:
     st.write('')
 with col2:
-    title_image = Image.open(Path(__file__).parents[2] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg')
-    st.image(title_image)
+    # Streamlit reads the file itself, PIL is not needed
+    st.image(str(Path(__file__).parents[2] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg'))
 with col3:
     st.write('')
 
@@ -65,11 +68,14 @@ st.text("") # Horizontal space
 st.markdown("### **Date distribution for articles containing your keywords**")
 col1_1, col1_2 = st.columns(2, gap="large")
 with st.container():
-    # Create and display histogram
+    # Create and display histogram, binned here so only the bars are sent to the browser
     with col1_1:
-        fig = px.histogram(input_df, x="Date", title='Frequency of publication of articles containing your keywords',
-         color_discrete_sequence=['#a8ddb5'])
-        st.plotly_chart(fig, use_container_width=True, sharing="streamlit")
+        granularity = st.radio("Group articles by:", ("Month", "Week", "Day"), horizontal=True)
+        with stage('dates.histogram', rows=len(rows)):
+            histogram = date_histogram(corpus.days[rows], granularity[0])
+            fig = px.bar(histogram, x="Date", y="Articles", title='Frequency of publication of articles containing your keywords',
+             color_discrete_sequence=['#a8ddb5'])
+            st.plotly_chart(fig, use_container_width=True, sharing="streamlit")
     
     # Display summary of stats
     with col1_2:
@@ -77,12 +83,35 @@ with st.container():
         st.write("")
         st.write('**Date stats**')  
         st.write(f'Your keyword(s): {st.session_state["fill_kws"]}')
-        dic = dates_article(input_df)
-        st.markdown(f"""
-        * Month with most number of articles containing one of your keywords: **{dic['month_year']}**.
-        * Year with most number of articles containing one of your keywords: **{dic['year']}**.
-        * Longest time between articles: **{dic['max_time_between']}**, on **{dic['date_of_publication']}**.\
-            The article before that was on **{dic['date_previous_publication']}**.
-        * Last date of publication of an article containing one of your keywords: **{dic['date_max']}**.
-        """)
-        
\ No newline at end of file
+        with stage('dates.stats', rows=len(rows)):
+            if len(rows) > 0:
+                dic = date_stats(corpus.days[rows])
+                st.markdown(f"""
+                * Month with most number of articles containing one of your keywords: **{dic['month_year']}**.
+                * Year with most number of articles containing one of your keywords: **{dic['year']}**.
+                * Longest time between articles: **{dic['max_time_between']}**, on **{dic['date_of_publication']}**.\
+                    The article before that was on **{dic['date_previous_publication']}**.
+                * Last date of publication of an article containing one of your keywords: **{dic['date_max']}**.
+                """)
+            else:
+                st.write('Sorry, it seems like this word does not appear in the articles we have.')
+
+
+st.markdown("### **Compare the monthly trends of words**")
+trend_input = st.text_input('Write single words to compare, separated by commas:', value='vegan, vegetarian, plant',
+                            help='Trends are counted in the articles\' text, whatever the keywords chosen in the sidebar.')
+# Remove blanks and duplicates, keep the order
+trend_keywords = list(dict.fromkeys(word.strip().lower() for word in trend_input.split(',') if word.strip()))
+with stage('dates.trends', rows=len(trend_keywords)):
+    if trend_keywords:
+        try:
+            # Read from the precomputed word x month counts
+            trends = keyword_trends(corpus.trends, corpus.vocabulary, trend_keywords)
+            fig_trends = px.line(trends, x="Date", y=trend_keywords, title='Number of articles containing each word per month',
+                                 labels={'value': 'Articles', 'variable': 'Word'})
+            st.plotly_chart(fig_trends, use_container_width=True, sharing="streamlit")
+        except ValueError as error:
+            st.write(f'Sorry, {error} Trends can only be compared for single words.')
+
+# Timings of this run, behind the debug toggle
+timing_panel()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Keyword filter and country counting sharded over a pool of processes. The lower-case texts
+# are copied once into shared memory as UTF-8 bytes, so workers read their shard directly
+# instead of receiving pickled strings with every task. Other texts can be loaded into the
+# same pool, e.g. the batches of a stream, without starting new processes.
+
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from app_functions import count_countries
+
+
+# Texts and offsets of the shared corpus, attached once per worker process and texts loaded
+_shared = {}
+
+
+def _attach(data_name, offsets_name, size):
+    '''
+    Attaches the shared texts in a worker process, unless they are already attached.
+    '''
+    if _shared.get('names') == (data_name, offsets_name):
+        return
+    # The texts loaded before are released, the scanner has already unlinked them
+    segments = _shared.pop('segments', ())
+    _shared.clear()
+    for segment in segments:
+        segment.close()
+    # Pool workers share the resource tracker of the parent, which unlinks the segments
+    data = SharedMemory(name=data_name)
+    offsets = SharedMemory(name=offsets_name)
+    _shared['names'] = (data_name, offsets_name)
+    _shared['segments'] = (data, offsets)
+    _shared['data'] = data.buf
+    _shared['offsets'] = np.ndarray((size + 1,), dtype=np.int64, buffer=offsets.buf)
+
+
+def _text(shared, row):
+    '''
+    Returns the text of a row of the shared corpus.
+    '''
+    offsets = shared['offsets']
+    return bytes(shared['data'][offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+
+def _scan_shard(start, end, keywords, count, shared=None):
+    '''
+    Returns the rows of a shard containing at least one keyword and, if count is True,
+    the country mentions in these rows. Workers read the corpus attached by the pool
+    initializer, a serial scanner passes its own.
+    '''
+    shared = _shared if shared is None else shared
+    rows = []
+    texts = []
+    for row in range(start, end):
+        text = _text(shared, row)
+        if keywords is None or any(keyword in text for keyword in keywords):
+            rows.append(row)
+            if count:
+                texts.append(text)
+    # Countries are counted once per shard, over all its matching texts
+    counts = count_countries(texts) if texts else Counter()
+    return np.array(rows, dtype=np.int32), counts
+
+
+def _scan_task(segments, start, end, keywords, count):
+    '''
+    Scans a shard in a worker process, after attaching the texts loaded in the scanner.
+    '''
+    _attach(*segments)
+    return _scan_shard(start, end, keywords, count)
+
+
+class ParallelScanner:
+    '''
+    Scans a column of lower-case texts on a pool of processes, in shards of consecutive rows.
+
+    Use it as a context manager, or call close() to stop the pool and free the shared memory. 
+    load() replaces the texts and keeps the pool.
+
+            Parameters:
+                    texts (iterable): lower-case texts, e.g. df_lower['Text']
+                    workers (int): number of processes, all the CPUs if None; with 1 the
+                                   scan runs serially in the current process
+                    shards_per_worker (int): shards per process, more shards balance the load better
+                    min_shard_size (int): fewer shards for fewer texts, as each shard has a fixed 
+                                          cost (task, country matcher)
+    '''
+
+    def __init__(self, texts, workers=None, shards_per_worker=4, min_shard_size=500):
+        self.workers = workers or os.cpu_count()
+        self.shards_per_worker = shards_per_worker
+        self.min_shard_size = min_shard_size
+        # Kept by a serial scanner, so that scanners in the same process do not share it
+        self._shared = {}
+        self._data = self._offsets = None
+        self._pool = None if self.workers == 1 else ProcessPoolExecutor(self.workers)
+        self.load(texts)
+
+    def load(self, texts):
+        '''
+        Replaces the texts to scan. The pool is kept, its workers attach the new texts at 
+        their next task.
+
+                Parameters:
+                        texts (iterable): lower-case texts
+        '''
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        # SharedMemory does not accept a size of 0
+        data = SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+        offsets_segment = SharedMemory(create=True, size=offsets.nbytes)
+        for row, text in enumerate(encoded):
+            data.buf[offsets[row]:offsets[row + 1]] = text
+        offsets_segment.buf[:offsets.nbytes] = offsets.tobytes()
+        del encoded
+        self._free()
+        self.size = len(offsets) - 1
+        self._data, self._offsets = data, offsets_segment
+        if self._pool is None:
+            self._shared = {'data': self._data.buf,
+                            'offsets': np.ndarray((self.size + 1,), dtype=np.int64, buffer=self._offsets.buf)}
+
+    def _free(self):
+        '''
+        Frees the shared memory of the texts loaded.
+        '''
+        # The segments can only be closed once their buffers are released
+        self._shared.clear()
+        for segment in (self._data, self._offsets):
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self._data = self._offsets = None
+
+    def _shards(self):
+        n_shards = max(1, min(self.workers * self.shards_per_worker, self.size // self.min_shard_size))
+        bounds = np.linspace(0, self.size, n_shards + 1).astype(int)
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+    def scan(self, keywords_input=None, count=True):
+        '''
+        Returns the rows containing at least one of the keywords entered by user and the
+        country mentions in these rows, merged over all shards.
+
+        Keywords are matched as in search_rows (lower-case substrings).
+
+                Parameters:
+                        keywords_input (str): keywords separated by commas, all rows if None
+                        count (bool): count the countries mentioned in the matching rows
+
+                Returns:
+                        rows (array): sorted int32 row positions
+                        counts (Counter): mentions of each lower-case country name
+        '''
+        keywords = None
+        if keywords_input is not None:
+            keywords = [word.strip() for word in keywords_input.lower().split(',')]
+        tasks = [(start, end, keywords, count) for start, end in self._shards()]
+        if self._pool is None:
+            results = [_scan_shard(*task, self._shared) for task in tasks]
+        else:
+            segments = [(self._data.name, self._offsets.name, self.size)] * len(tasks)
+            results = list(self._pool.map(_scan_task, segments, *zip(*tasks)))
+        # Shards are consecutive, so concatenating keeps the rows sorted
+        rows = np.concatenate([shard_rows for shard_rows, _ in results]) if results else np.array([], dtype=np.int32)
+        counts = Counter()
+        for _, shard_counts in results:
+            counts.update(shard_counts)
+        return rows, counts
+
+    def close(self):
+        '''
+        Stops the pool and frees the shared memory.
+        '''
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._free()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
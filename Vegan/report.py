@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Writes the Keywords, Countries and Dates results of many keyword sets without the app,
+# e.g. for nightly reports. Every worker process loads the corpus once, then handles
+# keyword sets one after the other. With --stream, the CSV is read in batches instead, for
+# datasets larger than memory: it is read once, every keyword set being evaluated on each
+# batch, scanned on a pool of processes (--workers 1 scans serially).
+# Usage: python report.py keyword_sets.txt reports/ [--wordcloud] [--map] [--workers N] [--stream]
+# The input file has one keyword set per line, written as in the sidebar (keywords
+# separated by commas). Blank lines and lines starting with # are ignored.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app_functions import (build_corpus, create_df_countries, create_map, create_wordcloud, date_stats, iter_chunks,
+                           search_rows, stream_analyses, word_frequencies, wordcloud_stopwords, write_tokens)
+
+
+DATA_PATH = Path(__file__).parent / 'Vegan_Articles.csv'
+# Same stop words as the wordcloud of the Keywords page
+REPORT_STOPWORDS = set(wordcloud_stopwords()) | set('s')
+
+# Corpus of the worker process, loaded by the pool initializer
+_worker = {}
+
+
+def read_keyword_sets(file_path):
+    '''
+    Returns the keyword sets of a file, one per line.
+
+            Parameters:
+                    file_path (str): path to the file of keyword sets
+
+            Returns:
+                    keyword_sets (list): keywords separated by commas, one string per set
+    '''
+    with open(file_path, encoding='utf-8') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def _load_corpus(data_path):
+    '''
+    Loads the corpus in a worker process (pool initializer).
+    '''
+    _worker['corpus'] = build_corpus(data_path)
+
+
+def keyword_report(corpus, keywords_input, col='Text', top=10):
+    '''
+    Returns the results of the app's pages for a keyword set.
+
+            Parameters:
+                    corpus (Corpus): corpus created with build_corpus
+                    keywords_input (str): keywords separated by commas
+                    col (str): column where countries are counted, Text or Title
+                    top (int): number of countries to keep
+
+            Returns:
+                    rows (array): row ids of the matching articles
+                    df_countries (DataFrame): mentions of every country in the matching articles
+                    report (dict): keywords, articles (number of matching articles),
+                                   top_countries (records) and dates (see date_stats, None without articles)
+    '''
+    rows = search_rows(keywords_input, corpus.df_lower, corpus.index)
+    matrix = corpus.countries_text if col == 'Text' else corpus.countries_title
+    df_countries = create_df_countries(None, col, matrix, rows=rows)
+    report = {'keywords': keywords_input,
+              'articles': len(rows),
+              'top_countries': df_countries.head(top).to_dict(orient='records'),
+              'dates': date_stats(corpus.days[rows]) if len(rows) else None}
+    return rows, df_countries, report
+
+
+def write_report(position, keywords_input, output_dir, col='Text', top=10, wordcloud=False, map_html=False):
+    '''
+    Writes the report of a keyword set in its own folder of output_dir (worker task).
+
+            Parameters:
+                    position (int): position of the keyword set in the input file, names the folder
+                    keywords_input (str): keywords separated by commas
+                    output_dir (str): folder of the reports
+                    col (str): column used for countries and for the wordcloud, Text or Title
+                    top (int): number of countries in the report
+                    wordcloud (bool): also write wordcloud.png
+                    map_html (bool): also write map.html
+
+            Returns:
+                    articles (int): number of matching articles
+    '''
+    corpus = _worker['corpus']
+    rows, df_countries, report = keyword_report(corpus, keywords_input, col, top)
+    folder = Path(output_dir) / f'{position:05d}'
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / 'report.json', 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=1, default=int)
+    if wordcloud and len(rows):
+        term_matrix = corpus.terms_text if col == 'Text' else corpus.terms_title
+        frequencies = word_frequencies(term_matrix, corpus.vocabulary, rows, REPORT_STOPWORDS)
+        if frequencies:
+            (folder / 'wordcloud.png').write_bytes(create_wordcloud(frequencies))
+    if map_html:
+        create_map(df_countries, 'equirectangular').write_html(folder / 'map.html', include_plotlyjs='cdn')
+    return report['articles']
+
+
+def run_reports(keyword_sets, output_dir, data_path=DATA_PATH, workers=None, **options):
+    '''
+    Writes the reports of many keyword sets on a pool of processes.
+
+            Parameters:
+                    keyword_sets (list): keywords separated by commas, one string per set
+                    output_dir (str): folder of the reports
+                    data_path (str): path to raw data
+                    workers (int): number of processes, all the CPUs if None
+                    options: col, top, wordcloud and map_html, see write_report
+
+            Returns:
+                    stats (dict): keyword_sets, seconds (including the corpus loads)
+                                  and sets_per_second
+    '''
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    # The snapshot and the tokens are written here if needed (write_tokens loads the snapshot), 
+    # so that the workers only read them
+    write_tokens(data_path)
+    with ProcessPoolExecutor(workers, initializer=_load_corpus, initargs=(data_path,)) as pool:
+        futures = [pool.submit(write_report, position, keywords_input, output_dir, **options)
+                   for position, keywords_input in enumerate(keyword_sets)]
+        for future in futures:
+            future.result()
+        seconds = time.perf_counter() - start
+    return {'keyword_sets': len(keyword_sets),
+            'seconds': seconds,
+            'sets_per_second': len(keyword_sets) / seconds if seconds else float('inf')}
+
+
+def run_stream_reports(keyword_sets, output_dir, data_path=DATA_PATH, workers=None, col='Text', top=10,
+                       map_html=False, chunksize=50000):
+    '''
+    Writes the reports of many keyword sets reading the raw data once in batches, see stream_analyses.
+
+    Reports are the same as with run_reports, without wordclouds.
+
+            Parameters:
+                    keyword_sets (list): keywords separated by commas, one string per set
+                    output_dir (str): folder of the reports
+                    data_path (str): path to raw data
+                    workers (int): number of processes scanning each batch, all the CPUs if None
+                    col (str): column used for countries, Text or Title
+                    top (int): number of countries in the report
+                    map_html (bool): also write map.html
+                    chunksize (int): number of rows per batch
+
+            Returns:
+                    stats (dict): keyword_sets, seconds and sets_per_second
+    '''
+    start = time.perf_counter()
+    analyses = stream_analyses(iter_chunks(data_path, chunksize), keyword_sets, col, workers)
+    for position, (keywords_input, analysis) in enumerate(zip(keyword_sets, analyses)):
+        report = {'keywords': keywords_input,
+                  'articles': analysis['articles'],
+                  'top_countries': analysis['countries'].head(top).to_dict(orient='records'),
+                  'dates': analysis['dates']}
+        folder = Path(output_dir) / f'{position:05d}'
+        folder.mkdir(parents=True, exist_ok=True)
+        with open(folder / 'report.json', 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=1, default=int)
+        if map_html:
+            create_map(analysis['countries'], 'equirectangular').write_html(folder / 'map.html', include_plotlyjs='cdn')
+    seconds = time.perf_counter() - start
+    return {'keyword_sets': len(keyword_sets),
+            'seconds': seconds,
+            'sets_per_second': len(keyword_sets) / seconds if seconds else float('inf')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the results of many keyword sets.')
+    parser.add_argument('keyword_sets', help='file with one keyword set per line')
+    parser.add_argument('output_dir', help='folder of the reports, one subfolder per keyword set')
+    parser.add_argument('--data', default=DATA_PATH, help='raw data CSV')
+    parser.add_argument('--column', choices=['Text', 'Title'], default='Text',
+                        help='column used for countries and wordclouds')
+    parser.add_argument('--top', type=int, default=10, help='number of countries in each report')
+    parser.add_argument('--wordcloud', action='store_true', help='also write wordcloud.png')
+    parser.add_argument('--map', action='store_true', help='also write map.html')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, all the CPUs by default')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the CSV in batches instead of loading the corpus (no wordclouds)')
+    args = parser.parse_args()
+    if args.stream and args.wordcloud:
+        parser.error('--wordcloud needs the corpus, it can not be used with --stream')
+    keyword_sets = read_keyword_sets(args.keyword_sets)
+    if args.stream:
+        stats = run_stream_reports(keyword_sets, args.output_dir, args.data, args.workers, col=args.column,
+                                   top=args.top, map_html=args.map)
+    else:
+        stats = run_reports(keyword_sets, args.output_dir, args.data, args.workers, col=args.column, top=args.top,
+                            wordcloud=args.wordcloud, map_html=args.map)
+    print(f"{stats['keyword_sets']} keyword sets in {stats['seconds']:.1f} s "
+          f"({stats['sets_per_second']:.1f} sets per second)")
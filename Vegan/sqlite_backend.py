@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Disk-backed search over the articles with SQLite (standard library), as an alternative to
+# keeping the texts in pandas. The database has a table of the articles and an FTS5 table of
+# their lower-case texts, with the same row ids as the Corpus. It is written once
+# (python ingest.py --sqlite) and then only read: every process opens the same file read-only
+# and memory-maps it, so the OS page cache holds a single copy for all of them.
+#
+# Keywords are matched like search_rows: substrings of the lower-case text of the snapshot
+# (lower_Text), any keyword. The FTS5 trigram tokenizer indexes every substring of 3
+# characters of these texts, as they are (case_sensitive 1), so MATCH is answered from the
+# index; shorter keywords fall back to instr over the texts. Matches are ranked with bm25.
+# The trigram tokenizer needs SQLite 3.34 or newer.
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app_functions import date_stats, load_table, normalize_keywords, snapshot_checksum, snapshot_path
+
+
+# Memory-mapped size of the database, larger than the file so that all of it is mapped
+MMAP_SIZE = 2**40
+# Stored in the metadata, databases written with another schema are out of date
+DATABASE_FORMAT = '2'
+SCHEMA = '''
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE articles (id INTEGER PRIMARY KEY, day INTEGER NOT NULL, link TEXT, title TEXT, text TEXT);
+CREATE INDEX articles_day ON articles (day);
+CREATE VIRTUAL TABLE articles_fts USING fts5(lower_text, tokenize='trigram case_sensitive 1');
+'''
+# Older SQLite versions allow 999 parameters per query
+MAX_PARAMETERS = 999
+ARTICLE_COLUMNS = ['Title', 'Date', 'Link', 'Text']
+ARTICLES_QUERY = 'SELECT articles.id, articles.title, articles.day, articles.link, articles.text FROM articles'
+
+
+def database_path(file_path):
+    '''
+    Returns the path of the SQLite database of a raw data file.
+
+            Parameters:
+                    file_path (str): path to raw data
+
+            Returns:
+                    path (Path): raw data path with a .sqlite extension
+    '''
+    return Path(file_path).with_suffix('.sqlite')
+
+
+def insert_articles(connection, table, start, chunksize=10000):
+    '''
+    Inserts the articles of a snapshot table into a database, in chunks.
+
+            Parameters:
+                    connection (Connection): connection to the database being written
+                    table (Table): articles, with the columns of the snapshot
+                    start (int): id of the first article
+                    chunksize (int): number of articles inserted at a time
+    '''
+    for batch in table.to_batches(max_chunksize=chunksize):
+        ids = range(start, start + batch.num_rows)
+        days = batch.column('Date').cast(pa.date32()).to_numpy(zero_copy_only=False).astype(np.int64).tolist()
+        columns = {col: batch.column(col).to_pylist() for col in ('Title', 'Text', 'Link', 'lower_Text')}
+        connection.executemany('INSERT INTO articles VALUES (?, ?, ?, ?, ?)',
+                               zip(ids, days, columns['Link'], columns['Title'], columns['Text']))
+        connection.executemany('INSERT INTO articles_fts (rowid, lower_text) VALUES (?, ?)',
+                               zip(ids, columns['lower_Text']))
+        start += batch.num_rows
+
+
+def write_database(file_path, chunksize=10000):
+    '''
+    Writes the SQLite database of a raw data file and of the batches appended to it.
+
+    Articles are read from the snapshot in chunks, so memory does not grow with the dataset.
+    The database is written next to its final path and renamed, so processes that opened the
+    previous version keep reading it until they reconnect. If the database was written from 
+    the same CSV before batches were appended, only these batches are added, to a copy of it.
+
+            Parameters:
+                    file_path (str): path to raw data
+                    chunksize (int): number of articles inserted at a time
+
+            Returns:
+                    path (Path): path of the database
+    '''
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        raise RuntimeError(f'The SQLite backend needs SQLite 3.34 or newer for its trigram tokenizer, '
+                           f'Python uses SQLite {sqlite3.sqlite_version}.')
+    table, version = load_table(file_path)
+    checksum = snapshot_checksum(snapshot_path(file_path))
+    path = database_path(file_path)
+    stored = None
+    if path.exists():
+        connection = connect(path)
+        try:
+            metadata = database_metadata(connection)
+        finally:
+            connection.close()
+        # Batches are only appended, so a database of the same snapshot and schema is a prefix
+        if ((metadata['csv_sha256'], metadata['format']) == (checksum, DATABASE_FORMAT)
+                and metadata['version'] <= version):
+            stored = metadata['version']
+    if stored == version:
+        return path
+    temporary_path = path.with_suffix('.sqlite.tmp')
+    temporary_path.unlink(missing_ok=True)
+    if stored is not None:
+        shutil.copyfile(path, temporary_path)
+    connection = sqlite3.connect(temporary_path)
+    try:
+        connection.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;')
+        if stored is None:
+            connection.executescript(SCHEMA)
+            insert_articles(connection, table, 0, chunksize)
+            connection.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+        else:
+            new_table, _ = load_table(file_path, start=stored)
+            # Ids are the row positions of the appended articles in the whole dataset
+            insert_articles(connection, new_table, table.num_rows - new_table.num_rows, chunksize)
+        connection.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)',
+                               [('csv_sha256', checksum), ('version', str(version)), ('format', DATABASE_FORMAT)])
+        connection.commit()
+    finally:
+        connection.close()
+    temporary_path.replace(path)
+    return path
+
+
+def connect(path):
+    '''
+    Opens a database written with write_database, read-only.
+
+    A connection must only be used by one thread at a time; open one per thread.
+
+            Parameters:
+                    path (Path): path of the database
+
+            Returns:
+                    connection (Connection)
+    '''
+    # immutable: the file is replaced, never modified, so SQLite does not need to lock it
+    connection = sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro&immutable=1', uri=True)
+    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    return connection
+
+
+def database_metadata(connection):
+    '''
+    Returns the dataset a database was written from, to compare it with the Corpus.
+
+            Parameters:
+                    connection (Connection): connection created with connect
+
+            Returns:
+                    metadata (dict): csv_sha256 (checksum of the raw data), version (number of batches 
+                                     appended) and format (DATABASE_FORMAT of the code that wrote it)
+    '''
+    metadata = dict(connection.execute('SELECT key, value FROM metadata').fetchall())
+    return {'csv_sha256': metadata.get('csv_sha256'),
+            'version': int(metadata['version']) if 'version' in metadata else None,
+            'format': metadata.get('format')}
+
+
+def matches_query(keywords_input):
+    '''
+    Returns the SQL query of the ids and scores of the articles containing at least one keyword.
+
+    Scores are bm25 ranks (lower is better); articles only found with a keyword shorter than
+    3 characters have a score of 0.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+
+            Returns:
+                    query (str): SQL query selecting id and score, or None to select all articles
+                    parameters (list): parameters of the query
+    '''
+    keywords = normalize_keywords(keywords_input)
+    # An empty keyword is contained in every article
+    if '' in keywords:
+        return None, []
+    long_keywords = [keyword for keyword in keywords if len(keyword) >= 3]
+    short_keywords = [keyword for keyword in keywords if len(keyword) < 3]
+    queries, parameters = [], []
+    if long_keywords:
+        queries.append('SELECT rowid AS id, rank AS score FROM articles_fts WHERE lower_text MATCH ?')
+        parameters.append(' OR '.join('"' + keyword.replace('"', '""') + '"' for keyword in long_keywords))
+    for keyword in short_keywords:
+        # instr compares the strings as they are, unlike LIKE which ignores ASCII case
+        queries.append('SELECT rowid AS id, 0.0 AS score FROM articles_fts WHERE instr(lower_text, ?) > 0')
+        parameters.append(keyword)
+    query = 'SELECT id, min(score) AS score FROM (' + ' UNION ALL '.join(queries) + ') GROUP BY id'
+    return query, parameters
+
+
+def search_ids(keywords_input, connection):
+    '''
+    Returns the ids of the articles containing at least one of the keywords entered by user.
+
+    Ids are the row positions of the Corpus, as for search_rows.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+                    connection (Connection): connection created with connect
+
+            Returns:
+                    rows (array): sorted int32 row ids
+    '''
+    query, parameters = matches_query(keywords_input)
+    if query is None:
+        query = 'SELECT id FROM articles'
+    rows = connection.execute(f'SELECT id FROM ({query}) ORDER BY id', parameters).fetchall()
+    return np.array([row for row, in rows], dtype=np.int32)
+
+
+def articles_frame(rows):
+    '''
+    Returns a dataframe of articles from database rows (id, title, day, link, text).
+
+            Parameters:
+                    rows (list): tuples selected from the database
+
+            Returns:
+                    df (DataFrame): Title, Date, Link and Text columns, indexed by article id
+    '''
+    ids, titles, days, links, texts = zip(*rows) if rows else ([], [], [], [], [])
+    df = pd.DataFrame({'Title': titles,
+                       'Date': np.array(days, dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]'),
+                       'Link': links,
+                       'Text': texts},
+                      index=pd.Index(ids, dtype=np.int64))
+    return df[ARTICLE_COLUMNS]
+
+
+def create_df_keywords(keywords_input, connection, limit=None):
+    '''
+    Returns a dataframe with the articles that contain at least one of the keywords entered by user,
+    best matches first.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+                    connection (Connection): connection created with connect
+                    limit (int): maximal number of articles, all if None
+
+            Returns:
+                    input_df (DataFrame): Title, Date, Link and Text columns, indexed by article id
+    '''
+    query, parameters = matches_query(keywords_input)
+    if query is None:
+        sql = f'{ARTICLES_QUERY} ORDER BY articles.id'
+    else:
+        sql = f'{ARTICLES_QUERY} JOIN ({query}) AS matches ON matches.id = articles.id ORDER BY matches.score, articles.id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        parameters = parameters + [limit]
+    return articles_frame(connection.execute(sql, parameters).fetchall())
+
+
+def dates_article(keywords_input, connection):
+    '''
+    Returns a dictionary with relevant dates related to the articles containing the keywords.
+
+    Articles are counted per day in SQL, see date_stats for the dictionary.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+                    connection (Connection): connection created with connect
+
+            Returns:
+                    dictionary
+    '''
+    query, parameters = matches_query(keywords_input)
+    source = 'articles' if query is None else f'articles JOIN ({query}) AS matches ON matches.id = articles.id'
+    counts = connection.execute(f'SELECT day, count(*) FROM {source} GROUP BY day ORDER BY day', parameters).fetchall()
+    days, counts = zip(*counts) if counts else ([], [])
+    return date_stats(np.array(days, dtype=np.int64), np.array(counts, dtype=np.int64))
+
+
+def sample_articles(keywords_input, connection, n=10):
+    '''
+    Returns a random sample of the articles containing at least one of the keywords.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+                    connection (Connection): connection created with connect
+                    n (int): number of articles, fewer if fewer articles match
+
+            Returns:
+                    df (DataFrame): Title, Date, Link and Text columns, indexed by article id
+    '''
+    query, parameters = matches_query(keywords_input)
+    source = 'articles' if query is None else f'({query})'
+    # Only the ids are shuffled, texts are read for the sample only
+    sql = f'{ARTICLES_QUERY} WHERE articles.id IN (SELECT id FROM {source} ORDER BY random() LIMIT ?)'
+    return articles_frame(connection.execute(sql, parameters + [n]).fetchall())
+
+
+def articles_by_id(ids, connection):
+    '''
+    Returns the articles with some ids, e.g. the rows found by search_rows or query_rows.
+
+            Parameters:
+                    ids (array): article ids
+                    connection (Connection): connection created with connect
+
+            Returns:
+                    df (DataFrame): Title, Date, Link and Text columns, indexed by article id, in the order of ids
+    '''
+    ids = [int(article_id) for article_id in ids]
+    rows = []
+    # Stay below the number of parameters SQLite allows in a query
+    for start in range(0, len(ids), MAX_PARAMETERS):
+        chunk = ids[start:start + MAX_PARAMETERS]
+        sql = f'{ARTICLES_QUERY} WHERE articles.id IN ({", ".join("?" * len(chunk))})'
+        rows.extend(connection.execute(sql, chunk).fetchall())
+    return articles_frame(rows).reindex(ids)
+
+
+def iter_articles(keywords_input, connection, chunksize=10000):
+    '''
+    Yields the articles containing at least one of the keywords, in chunks ordered by id, e.g. to
+    export them without holding them all in memory.
+
+            Parameters:
+                    keywords_input (str): keywords separated by commas
+                    connection (Connection): connection created with connect
+                    chunksize (int): number of articles per dataframe
+
+            Returns:
+                    chunks (generator): dataframes with Title, Date, Link and Text columns, indexed by article id
+    '''
+    query, parameters = matches_query(keywords_input)
+    if query is None:
+        sql = f'{ARTICLES_QUERY} ORDER BY articles.id'
+    else:
+        sql = f'{ARTICLES_QUERY} WHERE articles.id IN (SELECT id FROM ({query})) ORDER BY articles.id'
+    cursor = connection.execute(sql, parameters)
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            return
+        yield articles_frame(rows)
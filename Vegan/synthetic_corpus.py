@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Seeded generator of synthetic news articles with the columns of Vegan_Articles.csv, used to
+# measure the app functions at sizes the real dataset does not reach (see benchmark.py).
+# Article lengths are log-normal, words follow a Zipf law over a fixed vocabulary, countries
+# are mentioned a few times per article (most often the popular ones) and publication
+# dates grow over five years. The same seed and size always give the same file.
+# Usage: python synthetic_corpus.py articles.csv 100000 [--seed 0]
+
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from app_functions import countries
+
+
+# Most frequent words, so that usual keywords match a realistic share of the articles
+COMMON_WORDS = ('the of and to a in for is on that with by it as from at are this be was has have its an '
+                'will their or more but not they which new food vegan plant based meat milk dairy products '
+                'company market protein alternative alternatives brand said consumers animal sales free '
+                'launch oat burger cheese health climate welfare restaurant menu chicken beef eggs vegetarian '
+                'plant-based meat-free sustainable industry growth investment startup retail supermarket '
+                'chain demand research study diet veganism veganuary flexitarian soy almond pea tofu').split()
+# Article length in words (log-normal) and country mentions per article (Poisson)
+MEDIAN_LENGTH = 450
+LENGTH_SIGMA = 0.6
+COUNTRIES_PER_ARTICLE = 2.0
+FIRST_DAY = datetime.date(2017, 1, 1)
+LAST_DAY = datetime.date(2021, 12, 31)
+
+
+def synthetic_vocabulary(size=50000, seed=0):
+    '''
+    Returns the vocabulary of the synthetic articles, most frequent words first.
+
+            Parameters:
+                    size (int): number of words
+                    seed (int): seed of the random words after COMMON_WORDS
+
+            Returns:
+                    vocabulary (array): words, as an array of str
+    '''
+    rng = np.random.default_rng(seed)
+    syllables = ['ba', 'ce', 'di', 'fo', 'gu', 'ka', 'le', 'mi', 'no', 'pu', 'ra', 'se',
+                 'ti', 'vo', 'zu', 'an', 'er', 'in', 'ot', 'us', 'ly', 'ing', 'ed', 'ion']
+    words = dict.fromkeys(COMMON_WORDS)
+    while len(words) < size:
+        # Words of 2 to 4 syllables, drawn in bulk; duplicates are dropped
+        lengths = rng.integers(2, 5, size)
+        draws = rng.integers(0, len(syllables), (size, 4)).tolist()
+        words.update(dict.fromkeys(''.join(syllables[i] for i in draw[:length])
+                                   for draw, length in zip(draws, lengths.tolist())))
+    words = list(words)
+    return np.array(words[:size], dtype=object)
+
+
+def generate_articles(n_articles, seed=0, chunksize=10000):
+    '''
+    Yields synthetic articles as dataframes with the Title, Date, Link and Text columns.
+
+            Parameters:
+                    n_articles (int): total number of articles
+                    seed (int): random seed
+                    chunksize (int): number of articles per dataframe
+
+            Returns:
+                    chunks (generator): dataframes of at most chunksize articles
+    '''
+    vocabulary = synthetic_vocabulary(seed=seed)
+    # Zipf law over word ranks
+    word_weights = 1 / np.arange(1, len(vocabulary) + 1) ** 1.1
+    word_weights /= word_weights.sum()
+    countries_list = np.array(countries(with_abbreviations=True), dtype=object)
+    country_weights = 1 / np.arange(1, len(countries_list) + 1) ** 1.2
+    country_weights /= country_weights.sum()
+    rng = np.random.default_rng(seed)
+    # The most popular countries first, in a random order (UK and USA are not always on top)
+    countries_list = countries_list[rng.permutation(len(countries_list))]
+    n_days = (LAST_DAY - FIRST_DAY).days + 1
+    # More and more articles are published every day
+    day_weights = np.linspace(1, 4, n_days)
+    day_weights /= day_weights.sum()
+    first_day = np.datetime64(FIRST_DAY, 'D')
+    for start in range(0, n_articles, chunksize):
+        size = min(chunksize, n_articles - start)
+        lengths = np.clip(rng.lognormal(np.log(MEDIAN_LENGTH), LENGTH_SIGMA, size), 30, 5000).astype(np.int64)
+        words = vocabulary[rng.choice(len(vocabulary), lengths.sum(), p=word_weights)]
+        # Country mentions replace words at random positions of their article
+        mentions = np.minimum(rng.poisson(COUNTRIES_PER_ARTICLE, size), lengths)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        articles = np.repeat(np.arange(size), mentions)
+        positions = offsets[articles] + (rng.random(len(articles)) * lengths[articles]).astype(np.int64)
+        words[positions] = countries_list[rng.choice(len(countries_list), len(positions), p=country_weights)]
+        texts = [' '.join(words[offsets[i]:offsets[i + 1]]) + '.' for i in range(size)]
+        texts = [text[0].upper() + text[1:] for text in texts]
+        title_lengths = rng.integers(6, 15, size)
+        title_words = vocabulary[rng.choice(200, title_lengths.sum())]
+        title_offsets = np.concatenate([[0], np.cumsum(title_lengths)])
+        titles = [' '.join(title_words[title_offsets[i]:title_offsets[i + 1]]).title() for i in range(size)]
+        # A tenth of the titles also mention a country
+        with_country = rng.random(size) < 0.1
+        title_countries = countries_list[rng.choice(len(countries_list), size, p=country_weights)]
+        titles = [f'{title} in {country}' if mention else title
+                  for title, country, mention in zip(titles, title_countries, with_country)]
+        days = first_day + rng.choice(n_days, size, p=day_weights)
+        yield pd.DataFrame({'Title': titles,
+                            'Date': pd.to_datetime(days).strftime('%m/%d/%Y'),
+                            'Link': [f'https://news.example.com/article/{i}' for i in range(start, start + size)],
+                            'Text': texts})
+
+
+def write_synthetic_corpus(file_path, n_articles, seed=0, chunksize=10000):
+    '''
+    Writes synthetic articles to a CSV file with the columns of Vegan_Articles.csv, in chunks.
+
+            Parameters:
+                    file_path (str): path of the CSV file
+                    n_articles (int): number of articles
+                    seed (int): random seed
+                    chunksize (int): number of articles generated at a time
+
+            Returns:
+                    file_path (str)
+    '''
+    for position, chunk in enumerate(generate_articles(n_articles, seed, chunksize)):
+        chunk.to_csv(file_path, mode='w' if position == 0 else 'a', header=position == 0, index=False)
+    return file_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic news articles.')
+    parser.add_argument('file_path', help='CSV file to write')
+    parser.add_argument('n_articles', type=int, help='number of articles')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    write_synthetic_corpus(args.file_path, args.n_articles, args.seed)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Per-stage timings of the app. A page starts a run with start_run(), then every function
+# decorated with @timed and every block in `with stage(...)` adds a record to the run: its
+# duration in milliseconds and, when known, the number of rows it handled. Records are
+# written as JSON lines to TIMING_LOG (set VEGAN_TIMING_LOG to change it, or to an empty
+# string to turn the file off). Outside a run (scripts, benchmarks) nothing is recorded.
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+TIMING_LOG = os.environ.get('VEGAN_TIMING_LOG', str(Path(__file__).parent / 'timings.jsonl'))
+
+# Streamlit runs the script of each session in its own thread
+_current = threading.local()
+_logger = logging.getLogger('vegan.timing')
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_logger_lock = threading.Lock()
+
+
+def _log(record):
+    '''
+    Writes a record to the timing log, opening the log at the first record.
+    '''
+    if not TIMING_LOG:
+        return
+    if not _logger.handlers:
+        with _logger_lock:
+            if not _logger.handlers:
+                handler = logging.FileHandler(TIMING_LOG, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                _logger.addHandler(handler)
+    _logger.info(json.dumps(record, default=str))
+
+
+def start_run(page):
+    '''
+    Starts recording the stages of a page run in the current thread, forgetting the previous run.
+
+            Parameters:
+                    page (str): name of the page
+    '''
+    _current.run = {'run': uuid.uuid4().hex, 'page': page, 'records': [], 'depth': 0, 'start': time.perf_counter()}
+
+
+def run_records():
+    '''
+    Returns the stages recorded since start_run, in the order they started.
+
+            Returns:
+                    records (list): dictionaries with stage, ms, rows, depth (0 for a page section) 
+                                    and start_ms (since start_run)
+    '''
+    run = getattr(_current, 'run', None)
+    return sorted(run['records'], key=lambda record: record['start_ms']) if run is not None else []
+
+
+def count_rows(value):
+    '''
+    Returns the number of rows of a result, None if it has no rows (image, figure...).
+
+            Parameters:
+                    value: result of a stage
+
+            Returns:
+                    rows (int)
+    '''
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) or hasattr(value, 'tocsr'):
+        return value.shape[0]
+    if isinstance(value, (list, dict)):
+        return len(value)
+    return None
+
+
+@contextmanager
+def stage(name, rows=None):
+    '''
+    Records the duration of a block in the current run.
+
+    The record it yields can be given the number of rows handled: record['rows'] = n.
+
+            Parameters:
+                    name (str): name of the stage, e.g. page.section or the function name
+                    rows (int): number of rows handled, if already known
+
+            Returns:
+                    record (dict)
+    '''
+    record = {'stage': name, 'rows': rows}
+    run = getattr(_current, 'run', None)
+    if run is None:
+        yield record
+        return
+    record['depth'] = run['depth']
+    run['depth'] += 1
+    start = time.perf_counter()
+    record['start_ms'] = (start - run['start']) * 1000
+    try:
+        yield record
+    finally:
+        record['ms'] = (time.perf_counter() - start) * 1000
+        run['depth'] -= 1
+        run['records'].append(record)
+        _log({'time': datetime.now(timezone.utc).isoformat(), 'run': run['run'], 'page': run['page'], **record})
+
+
+def timed(function=None, name=None):
+    '''
+    Decorator recording each call of a function as a stage of the current run, with the rows of its result.
+
+            Parameters:
+                    function (function): function to decorate
+                    name (str): name of the stage, the function name if None
+
+            Returns:
+                    function
+    '''
+    if function is None:
+        return functools.partial(timed, name=name)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_current, 'run', None) is None:
+            return function(*args, **kwargs)
+        with stage(name or function.__name__) as record:
+            result = function(*args, **kwargs)
+            record['rows'] = count_rows(result)
+        return result
+    return wrapper
@@ -1,18 +1,11 @@
-import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.express as px 
-from PIL import Image
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
-import matplotlib.pyplot as plt
 import streamlit as st
-import country_converter as coco
 from pathlib import Path
 
 
 # Custom library
-from app_functions import create_df_countries, create_map, load_data, create_text, countries, create_df_keywords
+from app_functions import word_frequencies, create_wordcloud, wordcloud_stopwords
+from article_store import get_corpus, article_rows, export_file, session_rows, session_query_key, session_memory_kb, cached_artifact, timing_panel
+from timing import start_run, stage
 
 #--------------------------------- ---------------------------------  ---------------------------------
 #--------------------------------- SETTING UP THE APP
@@ -21,11 +14,17 @@ from app_functions import create_df_countries, create_map, load_data, create_tex
 st.set_page_config(page_title="Home | Vegan News", 
                    page_icon=":newspaper:", 
                    layout='wide')
+start_run('Keywords')
+
+# Articles shown at a time in the table of articles
+ARTICLES_PER_PAGE = 10
 
 # Set up a sidebar that remains throughout the app, in all pages. 
 # Use session_state to save keywords entered by user.
 if 'fill_kws' not in st.session_state:
     st.session_state['fill_kws'] = 'alternative protein'
+if 'boolean_query' not in st.session_state:
+    st.session_state['boolean_query'] = False
 
 def change_value():
     st.session_state['fill_kws'] = keywords
@@ -35,19 +34,17 @@ with st.sidebar:
     st.markdown("### **Choose keywords**")
     st.markdown('These keywords will apply throughout the site. Feel free to change them as you want.')
     keywords = st.text_input(label = 'Write your keywords, separated by commas: ', value=st.session_state.fill_kws, key='fill_kws')
+    st.checkbox('Advanced search', value=st.session_state.boolean_query, key='boolean_query',
+                help='Search whole words with AND, OR, NOT, parentheses, "exact phrases" and prefixes ending with * (e.g. "plant-based" AND (milk OR chees*) NOT oat).')
     enter = st.button("Let's do it!", key='submit_kws', on_click=change_value)
 
-# Load dataset
-news = pd.read_csv(Path(__file__).parents[1] / 'Vegan/Vegan_Articles.csv')
-news['Date'] = pd.to_datetime(news['Date'], format="%m/%d/%Y")
-news_lower = news.apply(lambda x: x.astype(str).str.lower())
-news_lower['Date'] = pd.to_datetime(news_lower['Date'], format="%Y/%m/%d")
-if 'original_df' not in st.session_state:
-        st.session_state['original_df'] = news
-if 'lower_df' not in st.session_state:
-        st.session_state['lower_df'] = news_lower
-
-input_df = create_df_keywords(st.session_state['fill_kws'], st.session_state['lower_df'])
+# Load dataset: the corpus is shared by all sessions, each session only keeps the ids of its matching articles
+with stage('keywords.load') as record:
+    corpus = get_corpus()
+    rows = session_rows(corpus)
+    record['rows'] = len(rows)
+with st.sidebar:
+    st.caption(f'Memory used by this session: {session_memory_kb():.1f} kB')
 
 #---------------------------------------------------------------#
 # APP
@@ -58,8 +55,8 @@ col1, col2, col3 = st.columns((1,3,1))
 with col1:
     st.write('')
 with col2:
-    title_image = Image.open(Path(__file__).parents[1] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg')
-    st.image(title_image)
+    # Streamlit reads the file itself, PIL is not needed
+    st.image(str(Path(__file__).parents[1] / 'Vegan/resources/header_christina-deravedisian-unsplash.jpg'))
     st.write("")
 with col3:
     st.write('')
@@ -76,26 +73,41 @@ with st.container():
     # Dataframe containing articles
     with col1_1:
         st.markdown('### **Articles containing keywords**')
-        # Display a sample:
-        if len(input_df)>0:
-            st.markdown("Here is a sample of articles containing your keyword(s):")
-            x = min([10, len(input_df)])
-            input_df_original = news[news.index.isin(input_df.index.to_list())]
-            df_display = input_df_original.sample(x).reset_index(drop=True)
-            st.dataframe(df_display, hide_index=True)
-            st.write(f'There are {len(input_df)} articles containing your keyword(s): {st.session_state["fill_kws"]}.')
-            st.write("You can download a CSV file with all these articles containing your keywords 👇")
-            csv = input_df_original.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                "Download articles as CSV",
-                csv,
-                "articles.csv",
-                "text/csv",
-                key='articles-data'
-            )
+        with stage('keywords.articles', rows=len(rows)):
+            # The CSV file is only built when asked for, then written to disk (see export_file): the session
+            # only keeps its keywords until the download is clicked, and the shared artifact cache its wordclouds
+            export_key = session_query_key(corpus)
+            if st.session_state.get('export_key') != export_key:
+                st.session_state.pop('export_key', None)
+            if len(rows)>0:
+                st.write(f'There are {len(rows)} articles containing your keyword(s): {st.session_state["fill_kws"]}.')
+                # Only the articles of the current page are read, from the corpus or the database
+                n_pages = (len(rows) - 1) // ARTICLES_PER_PAGE + 1
+                page = st.number_input('Page', min_value=1, max_value=n_pages, value=1, step=1,
+                                       help=f'{ARTICLES_PER_PAGE} articles per page, {n_pages} pages.')
+                start = (page - 1) * ARTICLES_PER_PAGE
+                page_rows = rows[start:start + ARTICLES_PER_PAGE]
+                with stage('keywords.articles.dataframe', rows=len(page_rows)):
+                    st.dataframe(article_rows(corpus, page_rows).reset_index(drop=True), hide_index=True)
+                st.caption(f'Articles {start + 1} to {start + len(page_rows)} of {len(rows)}.')
+                st.write("You can download a CSV file with all these articles containing your keywords 👇")
+                if st.button('Prepare the CSV file', key='prepare-articles-data'):
+                    st.session_state['export_key'] = export_key
+                if 'export_key' in st.session_state:
+                    with stage('keywords.articles.csv', rows=len(rows)):
+                        path = export_file(corpus, rows)
+                    with open(path, 'rb') as csv_gzip:
+                        st.download_button(
+                            "Download articles as CSV",
+                            csv_gzip,
+                            "articles.csv.gz",
+                            "application/gzip",
+                            key='articles-data',
+                            on_click=lambda: st.session_state.pop('export_key', None)
+                        )
             
-        else:
-            st.write('Sorry, it seems like this word does not appear in the articles we have.')
+            else:
+                st.write('Sorry, it seems like this word does not appear in the articles we have.')
 
     # Create and display wordcloud
     with col1_2:
@@ -103,22 +115,25 @@ with st.container():
         where_to_look_wordcloud = st.radio(
         "Create wordcloud based on:",
         ("Articles' text", "Articles' title"), horizontal=True)
+        # Word counts per article are precomputed, only the selected rows are summed
         if where_to_look_wordcloud == "Articles' text":
-            text = create_text(input_df, 'Text')
+            col, term_matrix = 'Text', corpus.terms_text
         else:
-            text = create_text(input_df, 'Title')    
-        stopwords = set(STOPWORDS) | set('s')
+            col, term_matrix = 'Title', corpus.terms_title
+        stopwords = set(wordcloud_stopwords()) | set('s')
         stopwords_input = st.text_input('Type words to be excluded, separated by commas.',
                                             help='If you want any extra words to be excluded from the wordcloud, type them here. If not, leave the field blank.') 
         stopwords_list = [word.strip() for word in stopwords_input.split(',')]
         stopwords.update(stopwords_list)
-        try:
-            wordcloud = WordCloud(stopwords=stopwords, width=800, height=400, colormap='GnBu').generate(text)
-            # Display the generated image:
-            fig_cloud, ax = plt.subplots()
-            ax.imshow(wordcloud, interpolation='bilinear')
-            ax.axis("off")
-            fig_cloud.tight_layout(pad=0)
-            st.pyplot(fig_cloud)
-        except:
-            st.write('Sorry, it seems like the keyword(s) you chose do not appear in the articles, so we cannot plot the wordcloud.')
+        with stage('keywords.wordcloud', rows=len(rows)):
+            try:
+                # The same wordcloud is rendered only once for all sessions
+                key = ('wordcloud', session_query_key(corpus), col, frozenset(stopwords), None)
+                png = cached_artifact(key, lambda: create_wordcloud(word_frequencies(term_matrix, corpus.vocabulary, rows, stopwords)))
+                # Display the generated image:
+                st.image(png)
+            except:
+                st.write('Sorry, it seems like the keyword(s) you chose do not appear in the articles, so we cannot plot the wordcloud.')
+
+# Timings of this run, behind the debug toggle
+timing_panel()